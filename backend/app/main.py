@@ -1,20 +1,75 @@
 import os
-import psycopg2
-from fastapi import FastAPI, HTTPException
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
+from typing import Optional
 import json
 
 # Load environment variables
 load_dotenv()
 
+from app.utils import tiles
+
+# Startup is measured from here to the end of the lifespan startup and
+# logged against this budget (workers are restarted often when scaling).
+# Anything slow - schema setup, loading layers - runs in the background.
+STARTUP_STARTED = time.perf_counter()
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2"))
+# Schema setup belongs in the deploy step (python -m app.schema); set
+# DB_INIT_ON_STARTUP=1 to also run it on every worker boot
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "0") == "1"
+
+startup = {"seconds": None, "schema": "skipped", "model": "loading"}
+
+def init_schema():
+    from app.schema import init_db
+    startup["schema"] = "initializing"
+    try:
+        init_db()
+        startup["schema"] = "ready"
+    except Exception as e:
+        # The API still serves everything that does not need the database
+        startup["schema"] = "failed"
+        print(f"Database schema setup failed: {e}")
+
+def init_model():
+    from app.utils import crop_model
+    try:
+        crop_model.load_model()
+        startup["model"] = "ready"
+    except Exception as e:
+        # /analyze retries the load on its next request
+        startup["model"] = "failed"
+        print(f"Soil model could not be loaded: {e}")
+
 # Check for existing router or keep if needed, but primarily focusing on the requested deliverables
 try:
     from app.routers import soil
 except ImportError:
     soil = None
 
-app = FastAPI(title="BhoomiSanket API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the boundary layers in the background so the first /map request
+    # after a deploy does not pay for it. /ready turns healthy once they are warm.
+    from app.routers import map as map_router
+    loop = asyncio.get_running_loop()
+    if DB_INIT_ON_STARTUP:
+        app.state.schema = loop.run_in_executor(None, init_schema)
+    app.state.preload = loop.run_in_executor(None, map_router.preload_layers)
+    app.state.model = loop.run_in_executor(None, init_model)
+
+    startup["seconds"] = round(time.perf_counter() - STARTUP_STARTED, 3)
+    over = " - OVER BUDGET" if startup["seconds"] > STARTUP_BUDGET_SECONDS else ""
+    print(f"Startup took {startup['seconds']}s (budget {STARTUP_BUDGET_SECONDS}s){over}")
+    yield
+
+app = FastAPI(title="BhoomiSanket API", version="0.1.0", lifespan=lifespan)
 
 # CORS Configuration
 origins = [
@@ -29,6 +84,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursor of /farm-analysis/data, read by the browser client
+    expose_headers=["X-Next-After"],
 )
 
 # Include existing router if available
@@ -49,9 +106,10 @@ from app.routers import farm_analysis
 app.include_router(farm_analysis.router)
 
 def get_db_connection():
+    """psycopg2 connection from the shared pool; close() hands it back."""
+    from app.database import engine
     try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        return conn
+        return engine.raw_connection()
     except Exception as e:
         print(f"Database connection error: {e}")
         raise HTTPException(status_code=500, detail="Database connection failed")
@@ -60,24 +118,79 @@ def get_db_connection():
 def read_root():
     return {"message": "Welcome to BhoomiSanket API"}
 
+@app.get("/ready")
+def readiness():
+    """
+    Readiness probe for the load balancer: 503 until the map layers are warm
+    (layers that failed to load are retried; see map.warm_layer).
+    """
+    layers = dict(map.layer_status)
+    if not map.layers_ready():
+        return JSONResponse(status_code=503, content={"status": "warming", "layers": layers, "startup": startup})
+    return {"status": "ready", "layers": layers, "startup": startup}
+
+@app.get("/metrics/db")
+def database_metrics():
+    """
+    Connection pool usage: checked-out connections, saturation (share of
+    pool_size + max_overflow in use), and how long checkouts waited.
+    """
+    from app.database import pool_stats
+    return pool_stats()
+
+# soil_choropleth.geom is stored in lon/lat (EPSG:4326); a GiST index on it
+# is created by app.schema.init_db. Cells are properties + geometry only.
+CHOROPLETH_SRID = 4326
+CHOROPLETH_PROPERTIES = ["grid_id", "nitrogen", "phosphorus", "potassium", "soil_moisture"]
+# Grid values change with imports, so tiles are cached briefly
+CHOROPLETH_TILE_MAX_AGE = int(os.getenv("CHOROPLETH_TILE_MAX_AGE", "300"))
+
 @app.get("/choropleth")
-def get_choropleth():
+def get_choropleth(
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy in lon/lat"),
+    zoom: Optional[int] = Query(None, ge=0, le=tiles.MAX_ZOOM),
+):
+    """
+    Soil grid as one GeoJSON FeatureCollection, built in the database.
+    bbox= returns only the cells intersecting the viewport (GiST index);
+    zoom= simplifies cells to about one screen pixel at that zoom and trims
+    coordinate precision to match. Without either, the full grid at full
+    resolution, as before.
+    """
+    try:
+        bounds = tiles.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    geom = "geom"
+    digits = 9
+    params = {}
+    if zoom is not None:
+        tolerance = tiles.degrees_per_pixel(zoom)
+        geom = "ST_SimplifyPreserveTopology(geom, %(tolerance)s)"
+        params["tolerance"] = tolerance
+        # Finer than a pixel is invisible
+        digits = min(9, max(1, math.ceil(-math.log10(tolerance)) + 1))
+    where = ""
+    if bounds:
+        where = f"WHERE geom && ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, {CHOROPLETH_SRID})"
+        params.update(zip(("minx", "miny", "maxx", "maxy"), bounds))
+
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT current_database();")
-        print("FASTAPI DATABASE:", cur.fetchone())
-    
+
         # Efficient SQL query using PostGIS ST_AsGeoJSON and JSON functions
-        # This constructs the entire FeatureCollection in the database
-        query = """
+        # This constructs the entire FeatureCollection in the database, and
+        # it is fetched as text and sent as is - no decode / re-encode here
+        query = f"""
             SELECT json_build_object(
                 'type', 'FeatureCollection',
                 'features', COALESCE(json_agg(
                     json_build_object(
                         'type', 'Feature',
-                        'geometry', ST_AsGeoJSON(geom)::json,
+                        'geometry', ST_AsGeoJSON({geom}, {digits})::json,
                         'properties', json_build_object(
                             'grid_id', grid_id,
                             'nitrogen', nitrogen,
@@ -87,15 +200,16 @@ def get_choropleth():
                         )
                     )
                 ), '[]'::json)
-            )
-            FROM public.soil_choropleth;
+            )::text
+            FROM public.soil_choropleth
+            {where};
 
         """
         
-        cur.execute(query)
+        cur.execute(query, params)
         result = cur.fetchone()[0]
         
-        return result
+        return Response(content=result, media_type="application/json")
 
     except Exception as e:
         print(f"Error fetching choropleth data: {e}")
@@ -103,3 +217,59 @@ def get_choropleth():
     finally:
         if conn:
             conn.close()
+
+@app.get("/choropleth/tiles/{z}/{x}/{y}.pbf")
+def get_choropleth_tile(z: int, x: int, y: int):
+    """
+    Mapbox Vector Tile (layer "soil") of the grid cells in one XYZ tile,
+    encoded by PostGIS with ST_AsMVT. Only cells intersecting the tile are
+    read (GiST index) and they are simplified to the tile's resolution.
+    """
+    if not tiles.is_valid_tile(z, x, y):
+        raise HTTPException(status_code=400, detail=f"Invalid tile: {z}/{x}/{y}")
+
+    minx, miny, maxx, maxy = tiles.tile_bounds(z, x, y)
+    bminx, bminy, bmaxx, bmaxy = tiles.buffered_bounds(z, x, y)
+    params = {
+        "minx": minx, "miny": miny, "maxx": maxx, "maxy": maxy,
+        "bminx": bminx, "bminy": bminy, "bmaxx": bmaxx, "bmaxy": bmaxy,
+        # One tile unit, in metres
+        "tolerance": tiles.tile_size(z) / tiles.TILE_EXTENT,
+        "extent": tiles.TILE_EXTENT,
+        "buffer": tiles.TILE_BUFFER,
+    }
+    properties = ", ".join(CHOROPLETH_PROPERTIES)
+    query = f"""
+        WITH cells AS (
+            SELECT ST_AsMVTGeom(
+                       ST_SimplifyPreserveTopology(ST_Transform(geom, 3857), %(tolerance)s),
+                       ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, 3857),
+                       %(extent)s, %(buffer)s, true
+                   ) AS geom,
+                   {properties}
+            FROM public.soil_choropleth
+            WHERE geom && ST_Transform(
+                ST_MakeEnvelope(%(bminx)s, %(bminy)s, %(bmaxx)s, %(bmaxy)s, 3857), {CHOROPLETH_SRID}
+            )
+        )
+        SELECT ST_AsMVT(cells, 'soil', %(extent)s, 'geom') FROM cells WHERE geom IS NOT NULL
+    """
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(query, params)
+        data = cur.fetchone()[0]
+    except Exception as e:
+        print(f"Error encoding choropleth tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn:
+            conn.close()
+
+    headers = {"Cache-Control": f"public, max-age={CHOROPLETH_TILE_MAX_AGE}"}
+    if not data:
+        # Nothing to draw here - an empty tile is still cacheable
+        return Response(status_code=204, headers=headers)
+    return Response(content=bytes(data), media_type="application/vnd.mapbox-vector-tile", headers=headers)
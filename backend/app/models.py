@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime
 from app.database import Base
 from datetime import datetime
 
@@ -40,6 +40,12 @@ class SoilSample(Base):
     ndvi = Column(Float) 
     elevation = Column(Float)
     slope = Column(Float)
+
+    # Incremental imports: source_key identifies the row across uploads
+    # (CSV sample id, else a hash of its values), row_hash is a hash of the
+    # normalized values so unchanged rows are not rewritten.
+    source_key = Column(String, unique=True, index=True)
+    row_hash = Column(BigInteger)
     
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -69,3 +75,33 @@ class SoilCropData(Base):
     humidity = Column(Float)
     ph = Column(Float)
     rainfall = Column(Float)
+
+class SoilRegionAggregate(Base):
+    __tablename__ = "soil_region_aggregates"
+
+    # Materialized averages of soil_samples + soil_farm_data per region,
+    # refreshed after imports and joined into the map layers.
+    # level is 'state', 'district' or 'subdistrict'; region_key is the
+    # trimmed, lower-cased region name used for matching shapefile names.
+    level = Column(String(20), primary_key=True)
+    region_key = Column(String(150), primary_key=True)
+    region_name = Column(String(150))
+    sample_count = Column(Integer)
+
+    nitrogen = Column(Float)
+    phosphorus = Column(Float)
+    potassium = Column(Float)
+    ph = Column(Float)
+    oc = Column(Float)
+    zinc = Column(Float)
+    sulphur = Column(Float)
+    boron = Column(Float)
+    iron = Column(Float)
+    manganese = Column(Float)
+    copper = Column(Float)
+    moisture = Column(Float)
+    rainfall = Column(Float)
+    humidity = Column(Float)
+    temperature = Column(Float)
+
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 import uuid
 
+from app.utils import crop_model, fast_json, offload
+
 router = APIRouter(
     prefix="/analyze",
     tags=["analysis"]
@@ -32,26 +34,58 @@ class AnalysisResponse(BaseModel):
 @router.post("/", response_model=AnalysisResponse)
 async def analyze_soil(request: AnalysisRequest):
     try:
-        # Mock Logic: Generate an ID and a dummy score
-        # In a real app, this would save to DB and trigger ML model
-        
         analysis_id = str(uuid.uuid4())
-        
-        # Simple mock score logic based on NPK
-        # Just to give variation
-        score = 0.5
-        if request.nitrogen > 100 and request.phosphorus > 20:
-             score = 0.85
-        elif request.ph < 5 or request.ph > 8:
-             score = 0.4
-             
+
+        # Measurements the form does not ask for take the reference medians
+        scores = await offload.run_model(crop_model.score_fields, {
+            "nitrogen": [request.nitrogen],
+            "phosphorus": [request.phosphorus],
+            "potassium": [request.potassium],
+            "soil_ph": [request.ph],
+        })
+
         return AnalysisResponse(
             analysis_id=analysis_id,
             message="Analysis started successfully",
-            suitability_score=score,
+            suitability_score=scores["suitability_score"][0],
 
             sub_district=request.sub_district
         )
     except Exception as e:
         print(f"Analysis Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+MAX_BATCH_FIELDS = 200000
+
+class BatchAnalysisRequest(BaseModel):
+    nitrogen: List[float] = Field(..., max_length=MAX_BATCH_FIELDS)
+    phosphorus: List[float] = Field(..., max_length=MAX_BATCH_FIELDS)
+    potassium: List[float] = Field(..., max_length=MAX_BATCH_FIELDS)
+    ph: List[float] = Field(..., max_length=MAX_BATCH_FIELDS)
+    temperature: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+    humidity: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+    rainfall: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+    sand: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+    silt: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+    clay: Optional[List[Optional[float]]] = Field(None, max_length=MAX_BATCH_FIELDS)
+
+@router.post("/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Score many fields in one call. Takes parallel arrays of measurements
+    (nitrogen, phosphorus, potassium, ph, and optionally temperature,
+    humidity, rainfall, sand, silt, clay; missing values may be null) and
+    answers with parallel arrays in the same order: suitability_score,
+    snsi_score, soil_status, profile and the nutrient / pH statuses.
+    """
+    columns = request.model_dump()
+    columns["soil_ph"] = columns.pop("ph")
+    lengths = {len(values) for values in columns.values() if values is not None}
+    if len(lengths) > 1:
+        raise HTTPException(status_code=400, detail="All columns must have the same length")
+    try:
+        scores = await offload.run_model(crop_model.score_fields, columns)
+        return fast_json.FastJSONResponse(scores)
+    except Exception as e:
+        print(f"Batch Analysis Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Optional
 from app.database import SessionLocal
 from app.schemas.farm_analysis import FarmDataResponse, LocationHierarchy
+from app.utils import farm_export, location_hierarchy
+from app.utils.response_cache import respond
+from app.utils.fast_json import FastJSONResponse
 
 router = APIRouter(
     prefix="/farm-analysis",
-    tags=["farm-analysis"]
+    tags=["farm-analysis"],
+    default_response_class=FastJSONResponse
 )
 
 def get_db():
@@ -17,95 +22,175 @@ def get_db():
     finally:
         db.close()
 
+# FarmDataResponse field -> (soil_farm_data column, type)
+FARM_DATA_COLUMNS = {
+    "farmer_id": ("farmer_id", "text"),
+    "state": ("state_name", "text"),
+    "district": ("district_name", "text"),
+    "subdistrict": ("subdistrict_name", "text"),
+    "latitude": ("latitude", "float"),
+    "longitude": ("longitude", "float"),
+    "nitrogen": ("nitrogen", "float"),
+    "phosphorus": ("phosphorus", "float"),
+    "potassium": ("potassium", "float"),
+    "ph": ("ph", "float"),
+    "organic_carbon": ("organic_carbon", "float"),
+    "moisture": ("moisture", "float"),
+    "soil_type": ("soil_type", "text"),
+    "recommended_fertilizer": ("recommended_fertilizer", "text"),
+}
+
+SQL_TYPES = {"text": "text", "float": "float8"}
+
+# Largest page /data hands out with limit=
+MAX_PAGE_SIZE = 10000
+
+# Page order of /data. The first part must match the
+# ix_soil_farm_data_farmer_key expression (app/schema.py) for the keyset
+# condition to be an index range scan; the COALESCE sorts null farmer_ids
+# first instead of leaving them out of every comparison. soil_farm_data is
+# owned by outside tooling and has no unique column, so rows sharing a
+# farmer_id are told apart by their physical location (ctid). That only
+# moves when a row is updated or the table rewritten, which the loaders
+# do not do between the pages of one pull.
+PAGE_KEY = "COALESCE(farmer_id::text, ''), ctid"
+
+def parse_page_cursor(after):
+    """(farmer_id, ctid) from an X-Next-After cursor "<block>,<offset>:<farmer_id>"; 400 when malformed."""
+    position, sep, farmer_id = after.partition(":")
+    block, comma, offset = position.partition(",")
+    if not sep or not comma or not block.isdigit() or not offset.isdigit():
+        raise HTTPException(status_code=400, detail="after must be the X-Next-After value of the previous page")
+    return farmer_id, f"({block},{offset})"
+
+def farm_data_select():
+    """SELECT list of the response fields, cast so every row has the same types."""
+    return ", ".join(
+        f"{column}::{SQL_TYPES[kind]} AS {field}"
+        for field, (column, kind) in FARM_DATA_COLUMNS.items()
+    )
+
+def location_filter(state=None, district=None, subdistrict=None):
+    """WHERE clause and parameters for the optional location filters."""
+    where = "WHERE 1=1"
+    params = {}
+    if state:
+        where += " AND state_name = :state"
+        params['state'] = state
+    if district:
+        where += " AND district_name = :district"
+        params['district'] = district
+    if subdistrict:
+        where += " AND subdistrict_name = :subdistrict"
+        params['subdistrict'] = subdistrict
+    return where, params
+
 @router.get("/locations", response_model=LocationHierarchy)
-def get_locations(db: Session = Depends(get_db)):
+def get_locations(request: Request):
     """
     Fetch unique States, Districts, and Subdistricts for dropdowns.
+    Served from an in-process cache with an ETag (304 when unchanged);
+    see app/utils/location_hierarchy.py for invalidation.
     """
     try:
-        # Fetch all unique locations
-        query = text("SELECT DISTINCT state_name, district_name, subdistrict_name FROM soil_farm_data WHERE state_name IS NOT NULL")
-        result = db.execute(query).fetchall()
-        
-        states = set()
-        districts = {} # state -> [districts]
-        subdistricts = {} # district -> [subdistricts]
-        
-        for row in result:
-            state = row.state_name
-            district = row.district_name
-            subdistrict = row.subdistrict_name
-            
-            states.add(state)
-            
-            if state not in districts:
-                districts[state] = set()
-            districts[state].add(district)
-            
-            if district not in subdistricts:
-                subdistricts[district] = set()
-            subdistricts[district].add(subdistrict)
-            
-        # Convert sets to sorted lists
-        return {
-            "states": sorted(list(states)),
-            "districts": {k: sorted(list(v)) for k, v in districts.items()},
-            "subdistricts": {k: sorted(list(v)) for k, v in subdistricts.items()}
-        }
+        entry = location_hierarchy.cached()
     except Exception as e:
         print(f"Error fetching locations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    return respond(request, entry)
 
 @router.get("/data", response_model=List[FarmDataResponse])
 def get_farm_data(
     state: Optional[str] = Query(None),
     district: Optional[str] = Query(None),
     subdistrict: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None),
+    stream: bool = Query(False),
     db: Session = Depends(get_db)
 ):
     """
     Fetch farm data filtered by location.
+
+    Pagination is keyset-based, in farmer_id order: pass limit=N for the
+    first page, then after=<X-Next-After header of that page> for the next
+    one. A page without X-Next-After is the last. stream=true sends the
+    JSON array incrementally from a server-side cursor instead of building
+    it in memory - use it for large unpaginated pulls (it carries no
+    cursor).
     """
+    where, params = location_filter(state, district, subdistrict)
+    paged = limit is not None or after is not None
+    select = farm_data_select()
+    if paged and not stream:
+        select += ", ctid::text AS page_ctid"
+    query_str = f"SELECT {select} FROM soil_farm_data {where}"
+    if after is not None:
+        query_str += f" AND ({PAGE_KEY}) > (:after_farmer_id, CAST(:after_ctid AS tid))"
+        params['after_farmer_id'], params['after_ctid'] = parse_page_cursor(after)
+    if paged:
+        query_str += f" ORDER BY {PAGE_KEY}"
+    if limit is not None:
+        query_str += " LIMIT :limit"
+        params['limit'] = limit
+
+    # Columns are cast in SQL to FarmDataResponse's types, so rows are
+    # serialized as they come instead of being validated one by one
+    if stream:
+        try:
+            connection, result = farm_export.open_cursor(query_str, params)
+        except Exception as e:
+            print(f"Error fetching farm data: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        columns = [(field, kind) for field, (_, kind) in FARM_DATA_COLUMNS.items()]
+        return StreamingResponse(
+            farm_export.stream("json", columns, connection, result),
+            media_type="application/json",
+        )
+
     try:
-        # Build query dynamically
-        query_str = "SELECT * FROM soil_farm_data WHERE 1=1"
-        params = {}
-        
-        if state:
-            query_str += " AND state_name = :state"
-            params['state'] = state
-        if district:
-            query_str += " AND district_name = :district"
-            params['district'] = district
-        if subdistrict:
-            query_str += " AND subdistrict_name = :subdistrict"
-            params['subdistrict'] = subdistrict
-            
-        # Execute
-        result = db.execute(text(query_str), params).fetchall()
-        
-        # Map to response model
-        farm_data = []
-        for row in result:
-            farm_data.append({
-                "farmer_id": row.farmer_id,
-                "state": row.state_name,
-                "district": row.district_name,
-                "subdistrict": row.subdistrict_name,
-                "latitude": row.latitude,
-                "longitude": row.longitude,
-                "nitrogen": row.nitrogen,
-                "phosphorus": row.phosphorus,
-                "potassium": row.potassium,
-                "ph": row.ph,
-                "organic_carbon": row.organic_carbon,
-                "moisture": row.moisture,
-                "soil_type": row.soil_type,
-                "recommended_fertilizer": row.recommended_fertilizer
-            })
-            
-        return farm_data
-        
+        result = db.execute(text(query_str), params)
+        farm_data = [dict(row) for row in result.mappings()]
+        headers = {}
+        if paged:
+            positions = [row.pop("page_ctid").strip("()") for row in farm_data]
+            if limit is not None and len(farm_data) == limit:
+                headers["X-Next-After"] = f"{positions[-1]}:{farm_data[-1]['farmer_id'] or ''}"
+        return FastJSONResponse(farm_data, headers=headers)
+
     except Exception as e:
         print(f"Error fetching farm data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export")
+def export_farm_data(
+    format: str = Query("csv", pattern="^(csv|arrow|parquet)$"),
+    state: Optional[str] = Query(None),
+    district: Optional[str] = Query(None),
+    subdistrict: Optional[str] = Query(None),
+):
+    """
+    Bulk export of farm data filtered by location, as CSV, Arrow IPC stream
+    or Parquet. Streamed in batches straight from a server-side cursor, so
+    whole states can be pulled without holding them in memory.
+    """
+    if format != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail=f"{format} export requires pyarrow")
+
+    where, params = location_filter(state, district, subdistrict)
+    query = f"SELECT {farm_data_select()} FROM soil_farm_data {where}"
+    try:
+        connection, result = farm_export.open_cursor(query, params)
+    except Exception as e:
+        print(f"Error exporting farm data: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    columns = [(field, kind) for field, (_, kind) in FARM_DATA_COLUMNS.items()]
+    return StreamingResponse(
+        farm_export.stream(format, columns, connection, result),
+        media_type=farm_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="farm_data.{format}"'},
+    )
@@ -1,107 +1,361 @@
-from fastapi import APIRouter, HTTPException, Query, Response
-import geopandas as gpd
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from typing import List
 import os
-import json
 import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from app.utils import tiles, topology, soil_aggregates, offload, fast_json
+from app.utils.boundary_layers import (
+    STATE_SHP, DISTRICT_SHP, SUBDISTRICT_SHP, LAYER_PATHS,
+    STATE_CANDIDATES, DISTRICT_CANDIDATES, SUBDISTRICT_NAME_CANDIDATES,
+    load_shapefile, find_col, load_point_locator, single_flight,
+)
+from app.utils.response_cache import ResponseCache, respond
 
 router = APIRouter(
     prefix="/map",
     tags=["map"]
 )
 
-# Paths to shapefiles
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-SHAPEFILE_DIR = os.path.join(BASE_DIR, "data", "shapefiles")
+# Final serialized GeoJSON per (level, filter value), bounded by memory.
+# Saves the to_json -> inject -> dumps cycle for repeat views.
+GEOJSON_CACHE_MAX_MB = int(os.getenv("GEOJSON_CACHE_MAX_MB", "256"))
+geojson_cache = ResponseCache(GEOJSON_CACHE_MAX_MB * 1024 * 1024)
+
+# Simplification pyramid: (max zoom, tolerance in degrees).
+# Tolerances are roughly half a screen pixel at the given web map zoom,
+# so each level looks identical to full detail where it is used.
+# Zooms above the last entry get the original, unsimplified geometry.
+SIMPLIFICATION_PYRAMID = [
+    (5, 0.02),
+    (7, 0.005),
+    (9, 0.001),
+    (11, 0.0003),
+]
 
-STATE_SHP = os.path.join(SHAPEFILE_DIR, "state", "STATE_BOUNDARY_wgs84.shp")
-DISTRICT_SHP = os.path.join(SHAPEFILE_DIR, "district", "DISTRICT_BOUNDARY_WGS84.shp")
-SUBDISTRICT_SHP = os.path.join(SHAPEFILE_DIR, "subdistrict", "SUBDISTRICT_BOUNDARY_WGS84.shp")
+def default_tolerance(count):
+    """Simplification tolerance of the default-detail layer for a layer of `count` features."""
+    # Adaptive Simplification Logic
+    tolerance = 0.001 # Default High detail
+    if count < 50: 
+         tolerance = 0.01 # Low detail (States)
+    elif count < 200:
+         tolerance = 0.005 # Medium detail (Districts)
+    return tolerance
 
-@lru_cache(maxsize=3) # Cache State, District, Subdistrict (3 files)
+@single_flight
+@lru_cache(maxsize=3)
 def load_and_simplify_shapefile(path):
     """
-    Loads shapefile from disk ONCE and caches it in RAM.
-    Also performs initial simplification to save CPU on subsequent calls.
+    Default-detail copy of a layer, used when the client gives no zoom.
+    Performs initial simplification to save CPU on subsequent calls.
+    """
+    return topology_layer(path, None)
+
+@single_flight
+@lru_cache(maxsize=3)
+def load_simplification_pyramid(path):
+    """
+    Precomputed simplifications of a layer, one per entry of
+    SIMPLIFICATION_PYRAMID, followed by the full-detail layer. The levels
+    are decoded from the same simplified arcs as the TopoJSON output, so
+    neighbours share identical borders at every level.
     """
-    if not os.path.exists(path):
-        print(f"Error: Shapefile not found at {path}")
+    gdf = load_shapefile(path)
+    if gdf is None:
         return None
-    
-    print(f"CACHE MISS: Loading {os.path.basename(path)} from disk...")
-    try:
-        gdf = gpd.read_file(path)
-        
-        # Adaptive Simplification Logic - Done ONCE during load
-        count = len(gdf)
-        tolerance = 0.001 # Default High detail
-        if count < 50: 
-             tolerance = 0.01 # Low detail (States)
-        elif count < 200:
-             tolerance = 0.005 # Medium detail (Districts)
-             
-        # Simplify geometries permanently in the cached copy
-        gdf['geometry'] = gdf.geometry.simplify(tolerance)
-        return gdf
-    except Exception as e:
-        print(f"Error loading shapefile: {e}")
+
+    start_time = time.time()
+    levels = [topology_layer(path, level) for level in range(len(SIMPLIFICATION_PYRAMID))]
+    levels.append(gdf)
+
+    print(f"Built {len(levels)}-level pyramid for {os.path.basename(path)} in {time.time() - start_time:.2f}s")
+    return levels
+
+def topology_layer(path, level):
+    """
+    Copy of a layer with the geometries of load_topology(path, level).
+    A polygon the arc simplification collapses or leaves invalid is
+    simplified on its own instead (it may then not match its neighbours).
+    """
+    gdf = load_shapefile(path)
+    topo = load_topology(path, level)
+    if gdf is None or topo is None:
+        return None
+
+    layer = gdf.copy()
+    layer['geometry'] = topology.topology_geometries(topo)
+    broken = layer.geometry.isna() | layer.geometry.is_empty | ~layer.geometry.is_valid
+    if broken.any():
+        tolerance = level_tolerance(gdf, level)
+        layer.loc[broken, 'geometry'] = gdf.geometry[broken].simplify(tolerance, preserve_topology=True)
+    return layer
+
+def pyramid_level(zoom):
+    """Index into the pyramid for a web map zoom, or None for the default layer."""
+    if zoom is None:
+        return None
+    for i, (max_zoom, _) in enumerate(SIMPLIFICATION_PYRAMID):
+        if zoom <= max_zoom:
+            return i
+    return len(SIMPLIFICATION_PYRAMID)
+
+def load_layer(path, level=None):
+    """Cached layer at the given pyramid level (None = default detail)."""
+    if level is None:
+        return load_and_simplify_shapefile(path)
+    levels = load_simplification_pyramid(path)
+    if levels is None:
+        return None
+    return levels[level]
+
+@single_flight
+@lru_cache(maxsize=3)
+def load_mercator_layer(path):
+    """
+    Web Mercator (EPSG:3857) copy of a cached layer for vector tiles.
+    Reprojected once; the spatial index is built here too so the first
+    tile request does not pay for it.
+    """
+    gdf = load_shapefile(path)
+    if gdf is None:
         return None
 
-# Helper: Find first matching column from detailed list
-def find_col(gdf, candidates):
-    cols = gdf.columns
-    for c in candidates:
-        if c in cols: return c
-    # Case insensitive check
-    lower_cols = {x.lower(): x for x in cols}
-    for c in candidates:
-        if c.lower() in lower_cols: return lower_cols[c.lower()]
+    print(f"Reprojecting {os.path.basename(path)} to EPSG:3857 for tiles...")
+    gdf_merc = gdf.to_crs(epsg=3857)
+    gdf_merc.sindex
+    return gdf_merc
+
+# Column holding each layer's own region name
+LAYER_NAME_CANDIDATES = {
+    "state": STATE_CANDIDATES,
+    "district": DISTRICT_CANDIDATES,
+    "subdistrict": SUBDISTRICT_NAME_CANDIDATES,
+}
+
+def normalize_name(name):
+    return str(name).strip().lower()
+
+# Helper for deterministic random values
+def get_val(seed, offset, min_v, max_v):
+    if not seed: seed = "unknown"
+    hash_val = int(hashlib.md5(seed.encode()).hexdigest(), 16)
+    sub_hash = (hash_val + offset) % 1000
+    return min_v + (sub_hash / 1000.0) * (max_v - min_v)
+
+# Columns tried, in order, for the name that seeds the mock values
+# Supports State, District, Subdistrict keys
+SOIL_SEED_COLUMNS = ['TEHSIL', 'SUB_DIST', 'DISTRICT', 'DIST_NAME', 'STATE', 'ST_NM']
+
+# (property, hash offset, min, max) of each mock soil attribute
+# Normalized values (0.0 - 1.0) for Choropleth coloring
+MOCK_SOIL_ATTRIBUTES = [
+    # 1. Macro Nutrients
+    ("N", 1, 0.2, 0.9),
+    ("P", 2, 0.1, 0.8),
+    ("K", 3, 0.3, 0.95),
+    # 2. pH & Organic Carbon
+    ("ph", 4, 0.4, 0.8),
+    ("oc", 5, 0.1, 0.9),
+    # 3. Micro Nutrients
+    ("Zn", 6, 0.2, 0.8),
+    ("S", 7, 0.3, 0.9),
+    ("B", 8, 0.1, 0.7),
+    ("Fe", 9, 0.2, 0.9),
+    ("Mn", 10, 0.2, 0.8),
+    ("Cu", 11, 0.1, 0.8),
+    # 4. Physical / Climate
+    ("moisture", 12, 0.2, 0.9),
+    ("rainfall", 14, 0.2, 0.9),
+    ("humidity", 15, 30, 80),
+    ("temperature", 16, 20, 40),
+]
+
+# Measured averages (soil_region_aggregates) replacing the mock values.
+# property -> aggregate column. Values are min-max scaled to 0-1 across the
+# regions of a level, like the mock ones, except humidity and temperature
+# which the frontend reads as raw values.
+MEASURED_SOIL_ATTRIBUTES = {
+    "N": "nitrogen", "P": "phosphorus", "K": "potassium",
+    "ph": "ph", "oc": "oc",
+    "Zn": "zinc", "S": "sulphur", "B": "boron", "Fe": "iron", "Mn": "manganese", "Cu": "copper",
+    "moisture": "moisture", "rainfall": "rainfall",
+    "humidity": "humidity", "temperature": "temperature",
+}
+RAW_SOIL_ATTRIBUTES = {"humidity", "temperature"}
+
+def layer_level(path):
+    for level, layer_path in LAYER_PATHS.items():
+        if layer_path == path:
+            return level
     return None
 
-def get_geojson(shp_path, filter_candidates=None, filter_val=None):
+@lru_cache(maxsize=6)
+def load_soil_attributes(path, version=0):
+    """
+    Soil attribute columns for every row of a layer, computed column-wise.
+    Regions with measured samples get their averages from the materialized
+    aggregates (version = soil_aggregates snapshot version); the rest keep
+    the deterministic mock values, one MD5 per distinct region name.
+    sample_count tells the two apart (0 = mock).
+    """
+    import numpy as np
+    import pandas as pd
+
+    gdf = load_shapefile(path)
+    if gdf is None:
+        return None
+
+    # First non-empty seed column per row, like `a or b or c`
+    seeds = pd.Series(None, index=gdf.index, dtype=object)
+    for col in SOIL_SEED_COLUMNS:
+        if col in gdf.columns:
+            vals = gdf[col].astype(object)
+            seeds = seeds.combine_first(vals.where(vals.notna() & (vals != "")))
+    seeds = seeds.fillna("unknown").astype(str)
+
+    # (hash + offset) % 1000 == (hash % 1000 + offset) % 1000
+    hashes = {name: int(hashlib.md5(name.encode()).hexdigest(), 16) % 1000 for name in seeds.unique()}
+    base = seeds.map(hashes).to_numpy(dtype=np.int64)
+
+    # USE MOCK DATA (Fallback/Demo)
+    columns = {}
+    for name, offset, min_v, max_v in MOCK_SOIL_ATTRIBUTES:
+        columns[name] = min_v + (((base + offset) % 1000) / 1000.0) * (max_v - min_v)
+    attrs = pd.DataFrame(columns, index=gdf.index)
+    attrs["sample_count"] = 0
+
+    level = layer_level(path)
+    aggregates = soil_aggregates.level_aggregates(level) if level else None
+    name_col = find_col(gdf, LAYER_NAME_CANDIDATES[level]) if level else None
+    if aggregates is None or aggregates.empty or not name_col:
+        return attrs
+
+    # Align the region averages to the layer rows by normalized name
+    keys = gdf[name_col].map(normalize_name)
+    measured = aggregates.reindex(keys.to_numpy())
+    measured.index = gdf.index
+
+    has_data = measured["sample_count"].notna()
+    attrs["sample_count"] = measured["sample_count"].fillna(0).astype(int)
+    for prop, col in MEASURED_SOIL_ATTRIBUTES.items():
+        vals = measured[col]
+        if prop not in RAW_SOIL_ATTRIBUTES:
+            lo, hi = aggregates[col].min(), aggregates[col].max()
+            vals = (vals - lo) / (hi - lo) if hi > lo else vals * 0 + 0.5
+        attrs[prop] = vals.where(has_data & vals.notna(), attrs[prop])
+
+    print(f"Joined soil aggregates into {os.path.basename(path)}: {int(has_data.sum())}/{len(gdf)} regions measured")
+    return attrs
+
+@lru_cache(maxsize=3 * (len(SIMPLIFICATION_PYRAMID) + 2))
+def load_map_layer(path, level=None, version=0):
+    """
+    Cached layer at a pyramid level with the soil attribute columns attached,
+    ready to serialize in a single pass.
+    """
+    gdf = load_layer(path, level)
+    attrs = load_soil_attributes(path, version)
+    if gdf is None or attrs is None:
+        return None
+    return gdf.join(attrs)
+
+@lru_cache(maxsize=3)
+def load_partitions(path):
+    """
+    Row positions of a layer grouped by normalized state, district and
+    (state, district) keys. Built once per file; row order is the same at
+    every pyramid level, so the positions work for all of them.
+    A partition is None when the layer has no such column.
+    """
+    gdf = load_shapefile(path)
+    if gdf is None:
+        return None
+
+    state_col = find_col(gdf, STATE_CANDIDATES)
+    district_col = find_col(gdf, DISTRICT_CANDIDATES)
+    states = [normalize_name(v) for v in gdf[state_col].tolist()] if state_col else None
+    districts = [normalize_name(v) for v in gdf[district_col].tolist()] if district_col else None
+
+    def group(keys):
+        groups = {}
+        for pos, key in enumerate(keys):
+            groups.setdefault(key, []).append(pos)
+        return groups
+
+    return {
+        "state": group(states) if states else None,
+        "district": group(districts) if districts else None,
+        "state_district": group(zip(states, districts)) if states and districts else None,
+    }
+
+def filter_layer(gdf_cached, shp_path, state=None, district=None, bbox=None):
+    """
+    Rows of a cached layer in the given state and/or district (case-insensitive),
+    found through the prebuilt partitions instead of scanning the columns.
+    Returns an empty frame when the layer has no matching column.
+    bbox (minx, miny, maxx, maxy) further keeps only the rows intersecting
+    it, looked up in the layer's spatial index.
+    """
+    if not state and not district and not bbox:
+        return gdf_cached
+
+    positions = None
+    if state or district:
+        positions = name_positions(shp_path, state, district)
+    if bbox:
+        import numpy as np
+        from shapely.geometry import box
+
+        in_view = gdf_cached.sindex.query(box(*bbox), predicate="intersects")
+        positions = np.sort(in_view) if positions is None else np.intersect1d(positions, in_view)
+
+    return gdf_cached.iloc[positions]
+
+def name_positions(shp_path, state=None, district=None):
+    """Row positions for a state and/or district filter ([] when the layer lacks the column)."""
+    partitions = load_partitions(shp_path)
+    if district and state:
+        kind, key = "state_district", (normalize_name(state), normalize_name(district))
+    elif district:
+        kind, key = "district", normalize_name(district)
+    else:
+        kind, key = "state", normalize_name(state)
+
+    partition = partitions.get(kind) if partitions else None
+    if partition is None:
+        print(f"Warning: Could not find {kind} column in {shp_path}")
+        # Better to return Empty to avoid crashing frontend with wrong data level
+        return []
+
+    return partition.get(key, [])
+
+def get_geojson(shp_path, state=None, district=None, level=None, bbox=None):
     start_time = time.time()
     
     # USE CACHED LOADER
     # If the function is called with the same arguments, it returns the cached result.
     # We can trust lru_cache for this.
-    gdf_cached = load_and_simplify_shapefile(shp_path)
+    # Soil attributes are already columns of the cached frame.
+    gdf_cached = load_map_layer(shp_path, level, soil_aggregates.current_version())
     
     if gdf_cached is None:
         raise HTTPException(status_code=404, detail=f"Shapefile not found: {shp_path}")
     
-    # Work on a copy if filtering? 
-    # Actually, Pandas slices are efficient. We don't need a deep copy unless modifying values.
-    # We are just filtering rows.
-    gdf = gdf_cached 
-    
     try:
         # Filter if requested
-        if filter_candidates and filter_val:
-            col = find_col(gdf, filter_candidates)
-            if col:
-                # Case insensitive value match?
-                # Let's try direct first
-                gdf = gdf[gdf[col] == filter_val]
-                
-                # If empty, try case insensitive value match
-                if gdf.empty and isinstance(filter_val, str):
-                     print(f"Target '{filter_val}' not found directly, trying case-insensitive search...")
-                     # Can't reload here efficiently, use cached
-                     gdf = gdf_cached # Reset
-                     gdf = gdf[gdf[col].astype(str).str.lower() == filter_val.lower()]
-            else:
-                print(f"Warning: Could not find filter column from {filter_candidates} in {shp_path}")
-                # We return ALL if we can't filter? Or Empty? 
-                # Better to return Empty to avoid crashing frontend with wrong data level
-                return Response(content='{"type": "FeatureCollection", "features": []}', media_type="application/json")
+        gdf = filter_layer(gdf_cached, shp_path, state, district, bbox)
 
         if gdf.empty:
             return Response(content='{"type": "FeatureCollection", "features": []}', media_type="application/json")
         
-        # Geometry is ALREADY simplified in the cache loader!
-        # Just convert to JSON
+        # Geometry is ALREADY simplified in the cache loader / pyramid!
+        # Just convert to JSON - the only serialization in the request
         # OPTIMIZATION: Return Response directly to avoid double serialization (Dict -> JSON String)
-        json_str = gdf.to_json()
+        json_str = fast_json.geojson(gdf)
         
         duration = time.time() - start_time
         print(f"Request Loop Time: {duration:.4f}s")
@@ -112,91 +366,313 @@ def get_geojson(shp_path, filter_candidates=None, filter_val=None):
         print(f"Error processing shapefile: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Helper: Inject Data into GeoJSON
-def inject_soil_data(response_obj):
+@single_flight
+@lru_cache(maxsize=3)
+def load_full_topology(path):
+    """Shared-arc topology of the full-detail layer, built once per layer."""
+    gdf = load_shapefile(path)
+    if gdf is None:
+        return None
+
+    start_time = time.time()
+    topo = topology.build_topology(gdf)
+    print(f"Built topology for {os.path.basename(path)} in {time.time() - start_time:.2f}s")
+    return topo
+
+def level_tolerance(gdf, level=None):
+    """Simplification tolerance of a pyramid level (None = default detail, 0 = full detail)."""
+    if level is None:
+        return default_tolerance(len(gdf))
+    if level < len(SIMPLIFICATION_PYRAMID):
+        return SIMPLIFICATION_PYRAMID[level][1]
+    return 0
+
+@single_flight
+@lru_cache(maxsize=3 * (len(SIMPLIFICATION_PYRAMID) + 2))
+def load_topology(path, level=None):
+    """
+    Topology of a whole layer at one pyramid level, as a dict. The arcs of
+    the full-detail topology are simplified, each shared border once, so
+    neighbours keep identical borders at every level. Filtered TopoJSON
+    requests reuse it and only pick out their arcs.
+    """
+    topo = load_full_topology(path)
+    if topo is None:
+        return None
+
+    start_time = time.time()
+    result = topology.simplified_topology(topo, level_tolerance(load_shapefile(path), level))
+    print(f"Simplified topology for {os.path.basename(path)} (level {level}): "
+          f"{len(result['arcs'])} arcs in {time.time() - start_time:.2f}s")
+    return result
+
+def get_topojson(shp_path, object_name, state=None, district=None, level=None, bbox=None):
+    """
+    TopoJSON variant of get_geojson: every shared border is sent once.
+    """
+    start_time = time.time()
+
+    gdf_cached = load_map_layer(shp_path, level, soil_aggregates.current_version())
+    if gdf_cached is None:
+        raise HTTPException(status_code=404, detail=f"Shapefile not found: {shp_path}")
+
     try:
-        data = json.loads(response_obj.body)
-        
-        # Helper for deterministic random values
-        import hashlib
-        def get_val(seed, offset, min_v, max_v):
-            if not seed: seed = "unknown"
-            hash_val = int(hashlib.md5(seed.encode()).hexdigest(), 16)
-            sub_hash = (hash_val + offset) % 1000
-            return min_v + (sub_hash / 1000.0) * (max_v - min_v)
-
-        # --- DB DATA FETCH (Conceptual - simplified for now) ---
-        # In a real app, we would aggregate by State/District here.
-        # For now, we use the deterministic mock logic for visual consistency across levels.
-        
-        if 'features' in data:
-            for feature in data['features']:
-                props = feature['properties']
-                # Try to find a name for the seed / matching
-                # Supports State, District, Subdistrict keys
-                name_raw = (props.get('TEHSIL') or props.get('SUB_DIST') or 
-                           props.get('DISTRICT') or props.get('DIST_NAME') or 
-                           props.get('STATE') or props.get('ST_NM') or 
-                           str(props.get('id', 'unknown')))
-                           
-                # USE MOCK DATA (Fallback/Demo)
-                # Normalized values (0.0 - 1.0) for Choropleth coloring
-                # In real production, this would be: `db.query(func.avg(col)).group_by(region)`
-                
-                # 1. Macro Nutrients
-                props["N"] = get_val(name_raw, 1, 0.2, 0.9)
-                props["P"] = get_val(name_raw, 2, 0.1, 0.8)
-                props["K"] = get_val(name_raw, 3, 0.3, 0.95)
-                
-                # 2. pH & Organic Carbon
-                props["ph"] = get_val(name_raw, 4, 0.4, 0.8) 
-                props["oc"] = get_val(name_raw, 5, 0.1, 0.9) 
-                
-                # 3. Micro Nutrients
-                props["Zn"] = get_val(name_raw, 6, 0.2, 0.8)
-                props["S"]  = get_val(name_raw, 7, 0.3, 0.9)
-                props["B"]  = get_val(name_raw, 8, 0.1, 0.7)
-                props["Fe"] = get_val(name_raw, 9, 0.2, 0.9)
-                props["Mn"] = get_val(name_raw, 10, 0.2, 0.8)
-                props["Cu"] = get_val(name_raw, 11, 0.1, 0.8)
-                
-                # 4. Physical / Climate
-                props["moisture"] = get_val(name_raw, 12, 0.2, 0.9)
-                props["rainfall"] = get_val(name_raw, 14, 0.2, 0.9)
-                props["humidity"] = get_val(name_raw, 15, 30, 80)
-                props["temperature"] = get_val(name_raw, 16, 20, 40)
-
-        # Return new response
-        return Response(content=json.dumps(data), media_type="application/json")
-        
+        gdf = filter_layer(gdf_cached, shp_path, state, district, bbox)
+        topo = load_topology(shp_path, level)
+
+        positions = gdf_cached.index.get_indexer(gdf.index)
+        attrs = gdf.drop(columns=gdf.geometry.name)
+        # NaN -> None so the encoder writes null
+        properties = attrs.astype(object).where(attrs.notna(), None).to_dict(orient="records")
+
+        json_str = fast_json.dumps(topology.subset_topology(topo, positions, properties, object_name))
+
+        duration = time.time() - start_time
+        print(f"Request Loop Time (topojson): {duration:.4f}s")
+
+        return Response(content=json_str, media_type="application/json")
+
     except Exception as e:
-        print(f"Error injecting mock data: {e}")
-        return response_obj
+        print(f"Error building topojson: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def build_layer(key, shp_path, state=None, district=None, level=None, fmt="geojson", bbox=None):
+    """Serialize a layer and store it in the response cache (runs in the geo pool)."""
+    if fmt == "topojson":
+        resp = get_topojson(shp_path, key[0], state=state, district=district, level=level, bbox=bbox)
+    else:
+        resp = get_geojson(shp_path, state=state, district=district, level=level, bbox=bbox)
+    return geojson_cache.put(key, resp.body)
+
+async def serve_layer(request, layer, shp_path, state=None, district=None, level=None, fmt="geojson", bbox=None):
+    """
+    Serve a boundary layer from the serialized-response cache,
+    building (and caching) it on a miss.
+    Cache hits are answered on the event loop; misses are built in the
+    bounded geo pool, once for all concurrent requests with the same key.
+    """
+    if soil_aggregates.is_stale():
+        await offload.run_coalesced(("soil_aggregates",), soil_aggregates.reload)
+
+    key = (
+        layer,
+        normalize_name(state) if state else None,
+        normalize_name(district) if district else None,
+        level,
+        fmt,
+        soil_aggregates.current_version(),
+        bbox,
+    )
+    entry = geojson_cache.get(key)
+    if entry is None:
+        entry = await offload.run_coalesced(
+            ("layer",) + key, build_layer, key, shp_path,
+            state=state, district=district, level=level, fmt=fmt, bbox=bbox,
+        )
+    return respond(request, entry)
+
+# Web map zoom of the client view; picks a simplification level.
+# Omit it to get the previous default detail.
+ZoomQuery = Query(None, ge=0, le=22, description="Map zoom level, selects geometry detail")
+
+# geojson (default) or topojson - the latter sends each shared border once
+FormatQuery = Query("geojson", pattern="^(geojson|topojson)$")
+
+# Viewport of the client map; only features intersecting it are sent
+BboxQuery = Query(None, description="minx,miny,maxx,maxy in lon/lat")
+
+def viewport(bbox):
+    """
+    Parsed bbox query value snapped to the viewport grid, or None; 400 when
+    malformed. Snapping keeps the response-cache and in-flight keys to a
+    bounded set, so panning reuses entries instead of adding one per
+    request (the response may include a few features just outside the view).
+    """
+    if not bbox:
+        return None
+    try:
+        return tiles.snap_bbox(tiles.parse_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Warm-up state of each layer, reported by /ready
+layer_status = {level: "pending" for level in LAYER_PATHS}
+
+# A layer whose warm-up fails is tried again after this many seconds,
+# doubling per attempt up to the maximum
+PRELOAD_RETRY_SECONDS = float(os.getenv("PRELOAD_RETRY_SECONDS", "5"))
+PRELOAD_RETRY_MAX_SECONDS = float(os.getenv("PRELOAD_RETRY_MAX_SECONDS", "300"))
+
+def warm_layer(level, attempt=0):
+    """
+    Build everything a cold /map request for this layer would. On failure
+    the layer is marked "error" and warmed again later, in the background.
+    """
+    path = LAYER_PATHS[level]
+    layer_status[level] = "loading"
+    start_time = time.time()
+    try:
+        soil_aggregates.reload()
+        gdf = load_map_layer(path, None, soil_aggregates.current_version())
+        if gdf is None:
+            layer_status[level] = "missing"
+            print(f"Not preloading {level} layer: {path} does not exist")
+            return
+        load_partitions(path)
+        gdf.sindex
+        if level == "subdistrict":
+            load_subdistrict_name_index()
+        load_point_locator(path)
+        # zoom=, format=topojson and tile requests
+        load_simplification_pyramid(path)
+        load_full_topology(path)
+        load_mercator_layer(path)
+        layer_status[level] = "ready"
+        print(f"Preloaded {level} layer in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        layer_status[level] = "error"
+        delay = min(PRELOAD_RETRY_SECONDS * 2 ** attempt, PRELOAD_RETRY_MAX_SECONDS)
+        print(f"Error preloading {level} layer: {e} (retrying in {delay:g}s)")
+        # Daemon timer: a pending retry never holds up shutdown
+        retry = threading.Timer(delay, warm_layer, (level, attempt + 1))
+        retry.daemon = True
+        retry.start()
+
+def preload_layers():
+    """Warm the state, district and subdistrict layers in parallel."""
+    with ThreadPoolExecutor(max_workers=len(LAYER_PATHS)) as pool:
+        list(pool.map(warm_layer, LAYER_PATHS))
+
+def layers_ready():
+    """
+    Every layer is warm. A layer whose shapefile does not exist is part of
+    the deployment, not a warm-up failure, so it does not hold readiness
+    back (its routes answer 404, as they always have).
+    """
+    return all(status in ("ready", "missing") for status in layer_status.values())
 
 @router.get("/state")
-async def get_states():
-    resp = get_geojson(STATE_SHP)
-    return inject_soil_data(resp)
+async def get_states(request: Request, zoom: int = ZoomQuery, format: str = FormatQuery, bbox: str = BboxQuery):
+    return await serve_layer(request, "state", STATE_SHP, level=pyramid_level(zoom), fmt=format, bbox=viewport(bbox))
 
 @router.get("/district")
-async def get_districts(state: str = Query(None)):
-    resp = None
-    if state:
-        candidates = ["STATE", "ST_NM", "State_Name", "StateName", "stname"]
-        resp = get_geojson(DISTRICT_SHP, filter_candidates=candidates, filter_val=state)
-    else:
-        resp = get_geojson(DISTRICT_SHP)
-    return inject_soil_data(resp)
+async def get_districts(request: Request, state: str = Query(None), zoom: int = ZoomQuery, format: str = FormatQuery, bbox: str = BboxQuery):
+    return await serve_layer(request, "district", DISTRICT_SHP, state=state, level=pyramid_level(zoom), fmt=format, bbox=viewport(bbox))
 
 @router.get("/subdistrict")
-async def get_subdistricts(state: str = Query(None), district: str = Query(None)):
-    resp = None
-    if district:
-        candidates = ["DISTRICT", "DIST_NAME", "District_Name", "DistName", "dtname"]
-        resp = get_geojson(SUBDISTRICT_SHP, filter_candidates=candidates, filter_val=district)
-    else:
-        resp = get_geojson(SUBDISTRICT_SHP)
-    return inject_soil_data(resp)
+async def get_subdistricts(request: Request, state: str = Query(None), district: str = Query(None), zoom: int = ZoomQuery, format: str = FormatQuery, bbox: str = BboxQuery):
+    # state disambiguates districts that share a name across states
+    return await serve_layer(request, "subdistrict", SUBDISTRICT_SHP, state=state, district=district, level=pyramid_level(zoom), fmt=format, bbox=viewport(bbox))
+
+def build_tile(level, path, z, x, y):
+    gdf = load_mercator_layer(path)
+    if gdf is None:
+        raise HTTPException(status_code=404, detail=f"Shapefile not found: {path}")
+    return tiles.encode_tile(level, gdf, z, x, y)
+
+@router.get("/tiles/{level}/{z}/{x}/{y}.pbf")
+async def get_tile(level: str, z: int, x: int, y: int):
+    """
+    Mapbox Vector Tile for a boundary layer (state, district or subdistrict).
+    The client only fetches the tiles on screen, and tiles are cacheable
+    by any HTTP cache in front of the API.
+    """
+    path = LAYER_PATHS.get(level)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Unknown layer: {level}")
+    if not tiles.is_valid_tile(z, x, y):
+        raise HTTPException(status_code=400, detail=f"Invalid tile: {z}/{x}/{y}")
+
+    headers = {"Cache-Control": "public, max-age=86400"}
+    try:
+        data = await offload.run_coalesced(("tile", level, z, x, y), build_tile, level, path, z, x, y)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error encoding tile {level}/{z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if data is None:
+        # Nothing to draw here - an empty tile is still cacheable
+        return Response(status_code=204, headers=headers)
+
+    return Response(content=data, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+# Upper bound for the batch lookup, keeps one request from serializing the country
+MAX_BATCH_NAMES = 1000
+
+@lru_cache(maxsize=1)
+def load_subdistrict_name_index():
+    """
+    Normalized sub-district name -> row positions in the cached layer.
+    Built once, so a lookup is a dict hit instead of a full-column scan.
+    """
+    gdf = load_and_simplify_shapefile(SUBDISTRICT_SHP)
+    if gdf is None:
+        return None
+
+    col = find_col(gdf, SUBDISTRICT_NAME_CANDIDATES)
+    if not col:
+        raise HTTPException(status_code=500, detail="Could not identify sub-district column")
+
+    index = {}
+    for pos, val in enumerate(gdf[col].tolist()):
+        index.setdefault(normalize_name(val), []).append(pos)
+    return index
+
+def subdistrict_mock_properties(name):
+    # Mock Suitability Score (Deterministic based on name hash for consistency during demo)
+    # Using hash to give a number between 0.3 and 0.95
+
+    # Generate specific attributes
+    # Normalized scores (0-1) for visualization simplicity in frontend
+    # In a real app, these would be actual values (e.g. N=140 mg/kg) but mapped to 0-1 for color
+    
+    # For this demo, let's return normalized scores (0=Poor, 1=Good) for simplicity
+    # Or return raw values and normalize in frontend? 
+    # Requirement says: "Color based on computed value". 
+    # Let's return standardized 0-1 scores for each attribute for easier frontend averaging.
+    return {
+        "suitability_score": get_val(name, 0, 0.3, 0.95),
+        "nitrogen": get_val(name, 1, 0.2, 0.9),
+        "phosphorus": get_val(name, 2, 0.1, 0.8),
+        "potassium": get_val(name, 3, 0.3, 0.95),
+        "ph": get_val(name, 4, 0.4, 0.8), # Normalized: 0=Typical Acidic/Alkaline extremes, 1=Neutral
+        "moisture": get_val(name, 5, 0.2, 0.9)
+    }
+
+def lookup_subdistricts(names):
+    """
+    Rows of the cached sub-district layer for the given names, with the
+    mock attributes attached, plus the names that were not found.
+    """
+    gdf = load_and_simplify_shapefile(SUBDISTRICT_SHP)
+    index = load_subdistrict_name_index()
+    if gdf is None or index is None:
+        raise HTTPException(status_code=404, detail="Shapefile not found")
+
+    positions = []
+    row_props = []
+    missing = []
+    for name in names:
+        hits = index.get(normalize_name(name))
+        if not hits:
+            missing.append(name)
+            continue
+        props = subdistrict_mock_properties(name)
+        positions.extend(hits)
+        row_props.extend([props] * len(hits))
+
+    # Geometry is already simplified (0.001) in the cached layer
+    rows = gdf.iloc[positions].copy()
+    for key in (row_props[0] if row_props else {}):
+        rows[key] = [props[key] for props in row_props]
+    return rows, missing
+
+def subdistricts_geojson(names):
+    """GeoJSON text of the named sub-districts (None if none match) and the missing names."""
+    rows, missing = lookup_subdistricts(names)
+    return (None if rows.empty else fast_json.geojson(rows)), missing
 
 @router.get("/subdistrict_by_name/{name}")
 async def get_single_subdistrict(name: str):
@@ -205,65 +681,110 @@ async def get_single_subdistrict(name: str):
     Includes a mock suitability score for visualization.
     """
     try:
-        if not os.path.exists(SUBDISTRICT_SHP):
-             raise HTTPException(status_code=404, detail="Shapefile not found")
-
-        gdf = gpd.read_file(SUBDISTRICT_SHP)
-        
-        # Filter by subdistrict name
-        candidates = ["TEHSIL", "TEHSIL_NAM", "SUB_DIST", "SubDistrict", "Tehsil", "sdtname"]
-        col = find_col(gdf, candidates)
-        
-        if not col:
-            raise HTTPException(status_code=500, detail="Could not identify sub-district column")
-            
-        # Case insensitive match
-        gdf = gdf[gdf[col].astype(str).str.lower() == name.lower()]
+        # The mock values are seeded with the name as given, so coalesce on it verbatim
+        json_str, _ = await offload.run_coalesced(("subdistrict_by_name", name), subdistricts_geojson, [name])
         
-        if gdf.empty:
+        if json_str is None:
             raise HTTPException(status_code=404, detail="Sub-district not found")
-            
-        # Optimization: Simplify geometry
-        gdf['geometry'] = gdf.geometry.simplify(0.001)
-
-        # Mock Suitability Score (Deterministic based on name hash for consistency during demo)
-        # Using hash to give a number between 0.3 and 0.95
-        import hashlib
-        hash_val = int(hashlib.md5(name.encode()).hexdigest(), 16)
-        
-        # Helper to get deterministic float between min and max
-        def get_mock_val(seed_offset, min_val, max_val):
-             sub_hash = (hash_val + seed_offset) % 1000
-             return min_val + (sub_hash / 1000.0) * (max_val - min_val)
-
-        # Generate specific attributes
-        # Normalized scores (0-1) for visualization simplicity in frontend
-        # In a real app, these would be actual values (e.g. N=140 mg/kg) but mapped to 0-1 for color
-        
-        # For this demo, let's return normalized scores (0=Poor, 1=Good) for simplicity
-        # Or return raw values and normalize in frontend? 
-        # Requirement says: "Color based on computed value". 
-        # Let's return standardized 0-1 scores for each attribute for easier frontend averaging.
         
-        props = {
-            "suitability_score": get_mock_val(0, 0.3, 0.95),
-            "nitrogen": get_mock_val(1, 0.2, 0.9),
-            "phosphorus": get_mock_val(2, 0.1, 0.8),
-            "potassium": get_mock_val(3, 0.3, 0.95),
-            "ph": get_mock_val(4, 0.4, 0.8), # Normalized: 0=Typical Acidic/Alkaline extremes, 1=Neutral
-            "moisture": get_mock_val(5, 0.2, 0.9)
-        }
-        
-        # Add properties to the dataframe
-        for key, val in props.items():
-            gdf[key] = val
-        
-        return json.loads(gdf.to_json())
+        return Response(content=json_str, media_type="application/json")
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching sub-district: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class SubdistrictBatchRequest(BaseModel):
+    names: List[str] = Field(..., max_length=MAX_BATCH_NAMES)
+
+@router.post("/subdistrict_by_name")
+async def get_subdistricts_by_name(request: SubdistrictBatchRequest):
+    """
+    Fetch many sub-district polygons by name in one FeatureCollection.
+    Names that do not match are listed under "not_found".
+    """
+    try:
+        json_str, missing = await offload.run_in_pool(subdistricts_geojson, request.names)
+
+        if json_str is None:
+            json_str = b'{"type": "FeatureCollection", "features": []}'
+
+        # Foreign member on the FeatureCollection, allowed by RFC 7946
+        json_str = json_str[:-1] + b', "not_found": ' + fast_json.dumps(missing) + b'}'
+        return Response(content=json_str, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching sub-districts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Most detailed layer first; coarser layers only see the points it missed
+LOCATE_LEVELS = ["subdistrict", "district", "state"]
+
+# Upper bound for one batch lookup
+MAX_LOCATE_POINTS = 200000
+
+def locate_points(lat, lon):
+    """
+    State / district / subdistrict containing each point, as one list per
+    level (None where a point is outside every boundary of that level).
+    """
+    import numpy as np
+
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    result = {level: np.full(len(lat), None, dtype=object) for level in LOCATE_LEVELS}
+    pending = np.arange(len(lat))
+
+    for layer in LOCATE_LEVELS:
+        if not len(pending):
+            break
+        locator = load_point_locator(LAYER_PATHS[layer])
+        if locator is None:
+            continue
+        rows = locator.locate(lon[pending], lat[pending])
+        found = rows >= 0
+        for level in LOCATE_LEVELS:
+            result[level][pending[found]] = locator.lookup(rows[found], level)
+        pending = pending[~found]
+
+    return {level: values.tolist() for level, values in result.items()}
+
+@router.get("/locate")
+async def locate(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180)):
+    """
+    Reverse-geocode one GPS point to its state, district and subdistrict.
+    Levels the point is not inside are null.
+    """
+    try:
+        found = await offload.run_in_pool(locate_points, [lat], [lon])
+        return {"lat": lat, "lon": lon, **{level: values[0] for level, values in found.items()}}
+    except Exception as e:
+        print(f"Error locating point: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class LocateBatchRequest(BaseModel):
+    lat: List[float] = Field(..., max_length=MAX_LOCATE_POINTS)
+    lon: List[float] = Field(..., max_length=MAX_LOCATE_POINTS)
+
+@router.post("/locate")
+async def locate_batch(request: LocateBatchRequest):
+    """
+    Reverse-geocode many points at once. Takes parallel "lat" / "lon" arrays
+    and answers with parallel "state", "district" and "subdistrict" arrays
+    in the same order (null where a point is outside every boundary).
+    """
+    if len(request.lat) != len(request.lon):
+        raise HTTPException(status_code=400, detail="lat and lon must have the same length")
+    try:
+        found = await offload.run_in_pool(locate_points, request.lat, request.lon)
+        return fast_json.FastJSONResponse(found)
+    except Exception as e:
+        print(f"Error locating points: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/districts")
 def get_available_districts():
     """
@@ -1,6 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from app.schemas.soil import SoilAnalysisRequest, SoilAnalysisResponse
-import random
+from app.utils import crop_model, offload
 
 router = APIRouter(
     prefix="/api",
@@ -9,63 +9,55 @@ router = APIRouter(
 
 @router.post("/analyze-soil", response_model=SoilAnalysisResponse)
 async def analyze_soil(request: SoilAnalysisRequest):
-    # DUMMY ML LOGIC
-    # In a real app, this would load a model and predict.
-    
-    # Simulate processing logic based on inputs to make it feel slightly dynamic
-    # e.g., if N is low, recommend Urea.
-    
+    # Nutrient ratings and the SNSI score come from the soil model trained on
+    # Crop_recommendation.csv (app/utils/crop_model.py)
+    try:
+        # Scored in the model pool: the first call may still load the model
+        scores = await offload.run_model(crop_model.score_fields, {
+            "nitrogen": [request.nitrogen],
+            "phosphorus": [request.phosphorus],
+            "potassium": [request.potassium],
+            "soil_ph": [request.ph],
+        })
+    except Exception as e:
+        print(f"Soil Analysis Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
     recommendations = []
-    
-    # Nitrogen logic (Mock)
-    n_status = "Optimal"
-    if request.nitrogen < 120:
+
+    # Nitrogen
+    n_status = scores["nitrogen_status"][0]
+    if n_status == "Low":
         recommendations.append("Apply 50 kg Urea/acre to boost Nitrogen.")
-        n_status = "Low"
-    elif request.nitrogen > 280:
+    elif n_status == "High":
         recommendations.append("Reduce Nitrogen fertilizers to prevent leaching.")
-        n_status = "High"
-        
-    # Phosphorus logic (Mock)
-    p_status = "Optimal"
-    if request.phosphorus < 15:
+
+    # Phosphorus
+    p_status = scores["phosphorus_status"][0]
+    if p_status == "Low":
          recommendations.append("Add DAP (Di-ammonium Phosphate) for root growth.")
-         p_status = "Low"
-         
-    # Potassium logic (Mock)
-    k_status = "Optimal"
-    if request.potassium < 100:
+
+    # Potassium
+    k_status = scores["potassium_status"][0]
+    if k_status == "Low":
         recommendations.append("Apply MOP (Muriate of Potash).")
-        k_status = "Low"
 
-    # pH logic (Mock)
-    ph_status = "Neutral"
-    if request.ph < 6:
+    # pH
+    ph_status = scores["ph_status"][0]
+    if ph_status == "Acidic":
         recommendations.append("Soil is acidic. Add Lime.")
-        ph_status = "Acidic"
-    elif request.ph > 7.5:
+    elif ph_status == "Alkaline":
         recommendations.append("Soil is alkaline. Add Gypsum.")
-        ph_status = "Alkaline"
-        
-    # Calculate dummy SNSI score based on rudimentary "health"
-    base_score = 85
-    if n_status != "Optimal": base_score -= 10
-    if p_status != "Optimal": base_score -= 5
-    if k_status != "Optimal": base_score -= 5
-    if ph_status != "Neutral": base_score -= 5
-    
-    # Add some randomness
-    snsi_score = max(40, min(100, base_score + random.randint(-5, 5)))
-    
-    # Determine Status
+
+    snsi_score = scores["snsi_score"][0]
+    soil_status = scores["soil_status"][0]
+
+    # Determine map class
     if snsi_score >= 80:
-        soil_status = "Excellent"
         map_class = "High"
     elif snsi_score >= 60:
-        soil_status = "Good"
         map_class = "Moderate"
     else:
-        soil_status = "Needs Attention"
         map_class = "Low"
         
     if not recommendations:
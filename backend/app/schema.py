@@ -0,0 +1,119 @@
+import os
+import time
+
+from sqlalchemy import text
+
+from app.database import Base, engine
+
+# Explicit, idempotent schema setup. Run once from the deploy step with
+# `python -m app.schema`, or at worker startup when DB_INIT_ON_STARTUP=1;
+# importing the app never touches the database.
+
+# How long a schema step may wait for a table lock. ALTER TABLE and CREATE
+# INDEX queue behind running imports and exports, and every reader of the
+# table then queues behind them, so a step that cannot get its lock quickly
+# fails instead (run the deploy step again once the table is quiet).
+DB_INIT_LOCK_TIMEOUT = os.getenv("DB_INIT_LOCK_TIMEOUT", "5s")
+
+# create_all only creates missing tables, so columns and indexes added to a
+# table after it first shipped are listed here, each with the object it
+# creates: ("column", "<table>.<column>"), ("index", "<name>") or
+# ("no index", "<name>") for drops. A step runs only when that object is
+# not already in place, so a schema that is up to date takes no locks.
+MIGRATIONS = [
+    ("column", "soil_samples.source_key", "ALTER TABLE soil_samples ADD COLUMN IF NOT EXISTS source_key VARCHAR"),
+    ("column", "soil_samples.row_hash", "ALTER TABLE soil_samples ADD COLUMN IF NOT EXISTS row_hash BIGINT"),
+    ("index", "ix_soil_samples_source_key",
+     "CREATE UNIQUE INDEX IF NOT EXISTS ix_soil_samples_source_key ON soil_samples (source_key)"),
+    # Region keys of the incremental aggregate refresh (soil_aggregates.region_key_sql)
+    ("index", "ix_soil_samples_district_key",
+     "CREATE INDEX IF NOT EXISTS ix_soil_samples_district_key ON soil_samples (lower(trim(district_name)))"),
+    ("index", "ix_soil_samples_subdistrict_key",
+     "CREATE INDEX IF NOT EXISTS ix_soil_samples_subdistrict_key ON soil_samples (lower(trim(subdistrict_name)))"),
+]
+
+# Same, for tables this app reads but does not own (loaded by other
+# tooling); applied only when the table exists, and skipped with a warning
+# when they fail.
+EXTERNAL_TABLE_MIGRATIONS = {
+    "soil_farm_data": [
+        # Keyset pagination of /farm-analysis/data, in farmer_id order with
+        # null farmer_ids first (see PAGE_KEY in routers/farm_analysis.py)
+        ("index", "ix_soil_farm_data_farmer_key",
+         "CREATE INDEX IF NOT EXISTS ix_soil_farm_data_farmer_key "
+         "ON soil_farm_data ((COALESCE(farmer_id::text, '')))"),
+        ("no index", "ix_soil_farm_data_farmer_id", "DROP INDEX IF EXISTS ix_soil_farm_data_farmer_id"),
+        ("no index", "ix_soil_farm_data_page", "DROP INDEX IF EXISTS ix_soil_farm_data_page"),
+        # Region keys of the incremental aggregate refresh
+        ("index", "ix_soil_farm_data_state_key",
+         "CREATE INDEX IF NOT EXISTS ix_soil_farm_data_state_key ON soil_farm_data (lower(trim(state_name)))"),
+        ("index", "ix_soil_farm_data_district_key",
+         "CREATE INDEX IF NOT EXISTS ix_soil_farm_data_district_key ON soil_farm_data (lower(trim(district_name)))"),
+        ("index", "ix_soil_farm_data_subdistrict_key",
+         "CREATE INDEX IF NOT EXISTS ix_soil_farm_data_subdistrict_key ON soil_farm_data (lower(trim(subdistrict_name)))"),
+        # Location hierarchy (DISTINCT over an index-only scan) and location filters
+        ("index", "ix_soil_farm_data_location",
+         "CREATE INDEX IF NOT EXISTS ix_soil_farm_data_location "
+         "ON soil_farm_data (state_name, district_name, subdistrict_name)"),
+    ],
+    "soil_choropleth": [
+        # bbox and tile queries of /choropleth
+        ("index", "ix_soil_choropleth_geom",
+         "CREATE INDEX IF NOT EXISTS ix_soil_choropleth_geom ON soil_choropleth USING GIST (geom)"),
+    ],
+}
+
+# Serializes init_db across workers booting at the same time
+SCHEMA_LOCK_ID = 7203141
+
+
+def _in_place(connection, kind, name):
+    """Whether a migration's object is already as the step would leave it (catalog reads only)."""
+    if kind == "column":
+        table, column = name.split(".")
+        query = ("SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+                 "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column)")
+        return connection.execute(text(query), {"table": table, "column": column}).scalar()
+    exists = connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND indexname = :name)"),
+        {"name": name},
+    ).scalar()
+    return exists if kind == "index" else not exists
+
+
+def init_db():
+    """Create missing tables and apply the pending migrations in one transaction."""
+    from app import models  # noqa: F401  (registers the tables on Base)
+
+    start = time.perf_counter()
+    applied = 0
+    with engine.begin() as connection:
+        # Index builds on large tables can outlast the API statement timeout
+        connection.execute(text("SET LOCAL statement_timeout = 0"))
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        # Set after the advisory lock: waiting for another worker's init_db is fine
+        connection.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": DB_INIT_LOCK_TIMEOUT})
+        Base.metadata.create_all(bind=connection)
+        for kind, name, statement in MIGRATIONS:
+            if not _in_place(connection, kind, name):
+                connection.execute(text(statement))
+                applied += 1
+        for table, statements in EXTERNAL_TABLE_MIGRATIONS.items():
+            exists = connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"public.{table}"}).scalar()
+            if not exists:
+                continue
+            for kind, name, statement in statements:
+                if _in_place(connection, kind, name):
+                    continue
+                # Someone else's table: a failure is logged, not fatal
+                try:
+                    with connection.begin_nested():
+                        connection.execute(text(statement))
+                    applied += 1
+                except Exception as e:
+                    print(f"Skipped schema step on {table}: {e}")
+    print(f"Database schema ready in {time.perf_counter() - start:.2f}s, {applied} migration step(s) applied")
+
+
+if __name__ == "__main__":
+    init_db()
@@ -0,0 +1,98 @@
+import os
+import threading
+from functools import lru_cache, wraps
+
+from app.utils import geolocate
+
+# The boundary shapefiles and the caches built straight from them, shared by
+# the map router and the soil import (which places rows by coordinates).
+# GeoPandas is only imported once a layer is actually read.
+
+# Paths to shapefiles
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SHAPEFILE_DIR = os.path.join(BASE_DIR, "data", "shapefiles")
+
+STATE_SHP = os.path.join(SHAPEFILE_DIR, "state", "STATE_BOUNDARY_wgs84.shp")
+DISTRICT_SHP = os.path.join(SHAPEFILE_DIR, "district", "DISTRICT_BOUNDARY_WGS84.shp")
+SUBDISTRICT_SHP = os.path.join(SHAPEFILE_DIR, "subdistrict", "SUBDISTRICT_BOUNDARY_WGS84.shp")
+
+# Level name -> shapefile, used by the tile endpoint
+LAYER_PATHS = {
+    "state": STATE_SHP,
+    "district": DISTRICT_SHP,
+    "subdistrict": SUBDISTRICT_SHP,
+}
+
+# One lock per shapefile: concurrent cold requests wait for a single read
+_load_locks = {}
+
+def load_shapefile(path):
+    """
+    Loads shapefile from disk ONCE and caches it in RAM, at full detail.
+    """
+    with _load_locks.setdefault(path, threading.Lock()):
+        return read_shapefile(path)
+
+@lru_cache(maxsize=3) # Cache State, District, Subdistrict (3 files)
+def read_shapefile(path):
+    if not os.path.exists(path):
+        print(f"Error: Shapefile not found at {path}")
+        return None
+    
+    print(f"CACHE MISS: Loading {os.path.basename(path)} from disk...")
+    try:
+        # Imported here so the app starts without paying for GeoPandas
+        import geopandas as gpd
+        return gpd.read_file(path)
+    except Exception as e:
+        # Raised, not returned as None: lru_cache keeps no exceptions, so
+        # a failed read (e.g. a flaky mount) is tried again on the next call
+        print(f"Error loading shapefile: {e}")
+        raise
+
+def single_flight(loader):
+    """
+    Wraps an lru_cache'd loader so concurrent cold calls with the same
+    arguments build the result once: the other callers wait for it and get
+    the cached copy (lru_cache alone lets every one of them build it).
+    """
+    locks = {}
+
+    @wraps(loader)
+    def load(*args):
+        with locks.setdefault(args, threading.Lock()):
+            return loader(*args)
+    return load
+
+# Helper: Find first matching column from detailed list
+def find_col(gdf, candidates):
+    cols = gdf.columns
+    for c in candidates:
+        if c in cols: return c
+    # Case insensitive check
+    lower_cols = {x.lower(): x for x in cols}
+    for c in candidates:
+        if c.lower() in lower_cols: return lower_cols[c.lower()]
+    return None
+
+STATE_CANDIDATES = ["STATE", "ST_NM", "State_Name", "StateName", "stname"]
+DISTRICT_CANDIDATES = ["DISTRICT", "DIST_NAME", "District_Name", "DistName", "dtname"]
+SUBDISTRICT_NAME_CANDIDATES = ["TEHSIL", "TEHSIL_NAM", "SUB_DIST", "SubDistrict", "Tehsil", "sdtname"]
+
+@single_flight
+@lru_cache(maxsize=3)
+def load_point_locator(path):
+    """
+    Point-in-polygon index over the unsimplified layer, so points near a
+    border land on the right side of it. Built once per layer.
+    """
+    gdf = load_shapefile(path)
+    if gdf is None:
+        return None
+
+    print(f"Building point index for {os.path.basename(path)}...")
+    return geolocate.PointLocator(gdf, {
+        "state": find_col(gdf, STATE_CANDIDATES),
+        "district": find_col(gdf, DISTRICT_CANDIDATES),
+        "subdistrict": find_col(gdf, SUBDISTRICT_NAME_CANDIDATES),
+    })
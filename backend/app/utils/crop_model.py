@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+
+# Soil model trained on Crop_recommendation.csv, used by /analyze and
+# /api/analyze-soil.
+#
+# The CSV has no crop label, only soil and climate measurements, so the
+# model is unsupervised:
+#   - k-means groups the standardized reference samples into soil profiles;
+#   - a field's suitability is how typical it is of the reference soils,
+#     i.e. the share of reference samples that sit farther from their nearest
+#     profile than the field does from its own (1.0 = as typical as it gets);
+#   - N / P / K are rated Low / Optimal / High against the 20th and 80th
+#     percentiles of the reference data.
+#
+# Training writes everything to one .npz artifact (plain arrays, no pickle),
+# loaded once per process. Scoring is a few array operations over all fields
+# at once, so a batch costs about the same as a single field plus its size.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CROP_DATA_CSV = os.getenv("CROP_DATA_CSV", os.path.join(os.path.dirname(BASE_DIR), "Crop_recommendation.csv"))
+CROP_MODEL_PATH = os.getenv("CROP_MODEL_PATH", os.path.join(BASE_DIR, "data", "models", "crop_model.npz"))
+CROP_MODEL_PROFILES = int(os.getenv("CROP_MODEL_PROFILES", "12"))
+
+FEATURES = [
+    "nitrogen", "phosphorus", "potassium",
+    "temperature", "humidity", "soil_ph", "rainfall",
+    "sand", "silt", "clay",
+]
+NUTRIENTS = ["nitrogen", "phosphorus", "potassium"]
+NUTRIENT_PERCENTILES = (20, 80)
+
+# pH classes are agronomic, not relative to the reference data
+ACIDIC_PH = 6.0
+ALKALINE_PH = 7.5
+
+KMEANS_ITERATIONS = 100
+KMEANS_SEED = 42
+
+
+class SoilModel:
+    """Fitted parameters; score() takes columns of raw measurements."""
+
+    def __init__(self, medians, mean, scale, centers, distance_quantiles, nutrient_bounds, trained_rows):
+        self.medians = medians
+        self.mean = mean
+        self.scale = scale
+        self.centers = centers
+        self.distance_quantiles = distance_quantiles
+        self.nutrient_bounds = nutrient_bounds
+        self.trained_rows = int(trained_rows)
+        self._center_norms = (centers ** 2).sum(axis=1)
+
+    def _matrix(self, columns, n):
+        """(n, features) array; missing columns and NaN cells take the reference median."""
+        import numpy as np
+
+        X = np.empty((n, len(FEATURES)), dtype="float64")
+        for i, name in enumerate(FEATURES):
+            values = columns.get(name)
+            X[:, i] = np.nan if values is None else np.asarray(values, dtype="float64")
+        missing = np.isnan(X)
+        X[missing] = np.broadcast_to(self.medians, X.shape)[missing]
+        return X
+
+    def _nearest(self, Z):
+        import numpy as np
+
+        # |z - c|^2 = |z|^2 - 2 z.c + |c|^2, one matrix product for all pairs
+        d2 = (Z ** 2).sum(axis=1)[:, None] - 2 * Z @ self.centers.T + self._center_norms
+        profile = d2.argmin(axis=1)
+        distance = np.sqrt(np.maximum(d2[np.arange(len(Z)), profile], 0))
+        return profile, distance
+
+    def score(self, columns):
+        """
+        Score fields given as {feature: array-like} of equal length (see
+        FEATURES; None entries become NaN). Returns a dict of arrays:
+        suitability_score (0-1), snsi_score (40-100), soil_status, profile,
+        and <nutrient>_status / ph_status.
+        """
+        import numpy as np
+
+        n = len(next(v for v in columns.values() if v is not None))
+        X = self._matrix(columns, n)
+        profile, distance = self._nearest((X - self.mean) / self.scale)
+
+        levels = np.linspace(0, 1, len(self.distance_quantiles))
+        suitability = 1 - np.interp(distance, self.distance_quantiles, levels)
+        snsi = np.round(40 + 60 * suitability, 1)
+
+        result = {
+            "suitability_score": np.round(suitability, 4),
+            "snsi_score": snsi,
+            "soil_status": np.select([snsi >= 80, snsi >= 60], ["Excellent", "Good"], "Needs Attention"),
+            "profile": profile,
+        }
+        for i, name in enumerate(NUTRIENTS):
+            low, high = self.nutrient_bounds[i]
+            values = X[:, FEATURES.index(name)]
+            result[f"{name}_status"] = np.select([values < low, values > high], ["Low", "High"], "Optimal")
+        ph = X[:, FEATURES.index("soil_ph")]
+        result["ph_status"] = np.select([ph < ACIDIC_PH, ph > ALKALINE_PH], ["Acidic", "Alkaline"], "Neutral")
+        return result
+
+    def save(self, path=CROP_MODEL_PATH):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            features=np.array(FEATURES),
+            medians=self.medians,
+            mean=self.mean,
+            scale=self.scale,
+            centers=self.centers,
+            distance_quantiles=self.distance_quantiles,
+            nutrient_bounds=self.nutrient_bounds,
+            trained_rows=np.array(self.trained_rows),
+        )
+
+    @classmethod
+    def load(cls, path=CROP_MODEL_PATH):
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as data:
+            if list(data["features"]) != FEATURES:
+                raise ValueError(f"{path} was trained on different features")
+            return cls(
+                data["medians"], data["mean"], data["scale"], data["centers"],
+                data["distance_quantiles"], data["nutrient_bounds"], data["trained_rows"],
+            )
+
+
+def _kmeans(Z, k):
+    """Lloyd's k-means with k-means++ seeding; deterministic for a given Z."""
+    import numpy as np
+
+    rng = np.random.default_rng(KMEANS_SEED)
+    centers = [Z[rng.integers(len(Z))]]
+    for _ in range(1, k):
+        d2 = ((Z[:, None, :] - np.array(centers)[None]) ** 2).sum(axis=2).min(axis=1)
+        centers.append(Z[rng.choice(len(Z), p=d2 / d2.sum())])
+    centers = np.array(centers)
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = ((Z[:, None, :] - centers[None]) ** 2).sum(axis=2).argmin(axis=1)
+        moved = np.array([Z[labels == j].mean(axis=0) if (labels == j).any() else centers[j] for j in range(k)])
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    return centers
+
+
+def train(csv_path=CROP_DATA_CSV, profiles=CROP_MODEL_PROFILES):
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    df.columns = [c.strip().lower() for c in df.columns]
+    missing = [name for name in FEATURES if name not in df.columns]
+    if missing:
+        raise ValueError(f"{csv_path} is missing columns: {missing}")
+
+    X = df[FEATURES].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    # Rows need the measured columns; texture gaps are filled with medians
+    X = X[~np.isnan(X[:, :FEATURES.index("rainfall") + 1]).any(axis=1)]
+    medians = np.nanmedian(X, axis=0)
+    X = np.where(np.isnan(X), medians, X)
+
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = (X - mean) / scale
+
+    centers = _kmeans(Z, profiles)
+    model = SoilModel(
+        medians, mean, scale, centers,
+        distance_quantiles=np.zeros(101),
+        nutrient_bounds=np.array([np.percentile(X[:, FEATURES.index(n)], NUTRIENT_PERCENTILES) for n in NUTRIENTS]),
+        trained_rows=len(X),
+    )
+    _, distance = model._nearest(Z)
+    model.distance_quantiles = np.quantile(distance, np.linspace(0, 1, 101))
+    return model
+
+
+_lock = threading.Lock()
+_model = None
+
+
+def load_model():
+    """
+    The process-wide model: read from CROP_MODEL_PATH, or trained from
+    CROP_DATA_CSV and written there when the artifact does not exist yet.
+    Blocking; call it from a worker thread.
+    """
+    global _model
+    if _model is not None:
+        return _model
+    with _lock:
+        if _model is None:
+            start_time = time.time()
+            if os.path.exists(CROP_MODEL_PATH):
+                _model = SoilModel.load(CROP_MODEL_PATH)
+                print(f"Loaded soil model from {CROP_MODEL_PATH} in {time.time() - start_time:.3f}s")
+            else:
+                _model = train()
+                print(f"Trained soil model on {_model.trained_rows} rows in {time.time() - start_time:.2f}s")
+                # Keep serving the trained model even where it cannot be written
+                try:
+                    _model.save(CROP_MODEL_PATH)
+                    print(f"Saved soil model to {CROP_MODEL_PATH}")
+                except OSError as e:
+                    print(f"Could not save soil model to {CROP_MODEL_PATH}: {e}")
+    return _model
+
+
+def score_fields(columns):
+    """score() with the process-wide model, as plain lists ready for JSON."""
+    scores = load_model().score(columns)
+    return {name: values.tolist() for name, values in scores.items()}
+
+
+if __name__ == "__main__":
+    # Retrain the artifact: python -m app.utils.crop_model
+    start_time = time.time()
+    model = train()
+    model.save(CROP_MODEL_PATH)
+    print(f"Trained soil model on {model.trained_rows} rows ({len(model.centers)} profiles) in {time.time() - start_time:.2f}s")
+    print(f"Saved to {CROP_MODEL_PATH}")
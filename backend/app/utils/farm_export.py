@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.utils import fast_json
+
+# Bulk export of soil_farm_data. Rows come off a server-side cursor
+# EXPORT_BATCH_ROWS at a time and every batch is encoded and sent before the
+# next one is fetched, so memory is bounded by one batch whatever the size
+# of the export. Arrow and Parquet need pyarrow; CSV and JSON do not.
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def open_cursor(query, params):
+    """
+    Run a query on its own connection with a server-side cursor.
+    Executed up front so errors surface before the response starts.
+    Returns (connection, result); stream() closes both.
+    """
+    connection = engine.connect().execution_options(stream_results=True)
+    try:
+        return connection, connection.execute(text(query), params)
+    except Exception:
+        connection.close()
+        raise
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only sink handed to pyarrow writers; whatever they wrote since the
+    last drain() is taken out and sent. tell() keeps counting, the Parquet
+    footer records row-group offsets from it.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_batches(columns, partitions):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def _json_batches(columns, partitions):
+    """One JSON array of objects, written a batch of elements at a time."""
+    names = [name for name, _ in columns]
+    yield b"["
+    first = True
+    for rows in partitions:
+        body = fast_json.dumps([dict(zip(names, row)) for row in rows])[1:-1]
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {"text": pa.string(), "float": pa.float64()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _arrow_batches(fmt, columns, partitions):
+    import pyarrow as pa
+
+    schema = arrow_schema(columns)
+    sink = _Drain()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for rows in partitions:
+        # Transpose once; each column becomes one contiguous Arrow array
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if fmt == "parquet":
+            # One row group per batch
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+
+    writer.close()
+    yield sink.drain()
+
+
+def stream(fmt, columns, connection, result):
+    """
+    Encode a result from open_cursor() as json, csv, arrow (IPC stream) or
+    parquet, one batch at a time. columns is [(name, "text" | "float")] in
+    SELECT order.
+    """
+    try:
+        partitions = result.partitions(EXPORT_BATCH_ROWS)
+        if fmt == "json":
+            yield from _json_batches(columns, partitions)
+        elif fmt == "csv":
+            yield from _csv_batches(columns, partitions)
+        else:
+            yield from _arrow_batches(fmt, columns, partitions)
+    except Exception as e:
+        # Headers are already sent; all we can do is cut the stream short
+        print(f"Error exporting farm data: {e}")
+        raise
+    finally:
+        result.close()
+        connection.close()
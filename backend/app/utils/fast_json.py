@@ -0,0 +1,63 @@
+import json
+
+from fastapi import Response
+
+# JSON encoding for the data-heavy endpoints. orjson (when installed)
+# encodes several times faster than the stdlib, writes NaN as null and
+# handles numpy scalars; without it everything falls back to json.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """Serialize to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode()
+
+
+def geojson(gdf):
+    """
+    GeoJSON bytes of a GeoDataFrame; same document as gdf.to_json().
+
+    Geometries are written by GEOS in one vectorized call and embedded as
+    pre-serialized fragments, instead of going through Python dicts of
+    coordinate tuples.
+    """
+    if orjson is None or not hasattr(orjson, "Fragment"):
+        return gdf.to_json().encode()
+
+    import shapely
+
+    geometries = shapely.to_geojson(gdf.geometry.values)
+    attrs = gdf.drop(columns=gdf.geometry.name)
+    properties = attrs.astype(object).where(attrs.notna(), None).to_dict(orient="records")
+    features = [
+        {
+            "id": str(idx),
+            "type": "Feature",
+            "properties": props,
+            "geometry": orjson.Fragment(geom) if geom is not None else None,
+        }
+        for idx, props, geom in zip(gdf.index, properties, geometries)
+    ]
+    return dumps({"type": "FeatureCollection", "features": features})
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with dumps().
+
+    Returned directly from an endpoint it is the trusted path: FastAPI skips
+    response_model validation, so use it for data already shaped by the
+    query. Set as a router's default_response_class, validated responses
+    are still encoded with orjson. Bytes are sent as they are.
+    """
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
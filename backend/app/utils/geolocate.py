@@ -0,0 +1,70 @@
+# Point -> polygon lookups in bulk.
+# An STRtree over the layer's polygons narrows every point down to the few
+# polygons whose bounding box contains it, then the exact point-in-polygon
+# tests run on prepared polygons straight from the coordinate arrays
+# (intersects_xy), all in C. Nothing here loops over points in Python.
+
+
+class PointLocator:
+    """
+    Spatial index over one polygon layer (lon/lat, EPSG:4326) answering
+    "which row contains this point" for arrays of points.
+    """
+
+    def __init__(self, gdf, columns):
+        """columns maps output name (e.g. "district") -> gdf column; None columns are skipped."""
+        import numpy as np
+        import shapely
+
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+
+        geoms = np.asarray(gdf.geometry.values, dtype=object)
+        valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+        # Tree index -> row position in gdf
+        self._rows = np.flatnonzero(valid)
+        self._geoms = geoms[valid]
+        shapely.prepare(self._geoms)
+        self.tree = shapely.STRtree(self._geoms)
+        # Missing names as None so results serialize straight to JSON
+        self.values = {
+            name: gdf[col].astype(object).where(gdf[col].notna(), None).to_numpy(dtype=object)
+            for name, col in columns.items() if col
+        }
+
+    def locate(self, lon, lat):
+        """Row position of the polygon containing each point, -1 where there is none."""
+        import numpy as np
+        import shapely
+
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        rows = np.full(len(lon), -1, dtype=np.int64)
+
+        ok = np.isfinite(lon) & np.isfinite(lat)
+        if not ok.any():
+            return rows
+
+        lon, lat = lon[ok], lat[ok]
+        # Bounding-box candidates first, exact test only on those pairs
+        point_idx, tree_idx = self.tree.query(shapely.points(lon, lat))
+        hit = shapely.intersects_xy(self._geoms[tree_idx], lon[point_idx], lat[point_idx])
+        point_idx, tree_idx = point_idx[hit], tree_idx[hit]
+        if len(point_idx):
+            # A point on a shared border matches both polygons; keep the first
+            _, first = np.unique(point_idx, return_index=True)
+            rows[np.flatnonzero(ok)[point_idx[first]]] = self._rows[tree_idx[first]]
+        return rows
+
+    def lookup(self, rows, name):
+        """Values of one output column for the rows from locate(); None where rows is -1."""
+        import numpy as np
+
+        rows = np.asarray(rows)
+        values = self.values.get(name)
+        out = np.full(len(rows), None, dtype=object)
+        if values is None:
+            return out
+        found = rows >= 0
+        out[found] = values[rows[found]]
+        return out
@@ -0,0 +1,155 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from app.database import SessionLocal
+
+# Background soil imports. The upload is spooled to a temp file by the
+# request, then a single worker thread imports queued files one at a time
+# (imports rewrite soil_samples, so running two at once would only make
+# them fight over the same rows). The queue is bounded: when it is full
+# new uploads are refused instead of piling up on disk.
+#
+# Job state lives in this process; with several web workers, poll the one
+# that accepted the upload.
+
+IMPORT_QUEUE_SIZE = int(os.getenv("IMPORT_QUEUE_SIZE", "10"))
+
+# Finished jobs kept around for status polling
+MAX_FINISHED_JOBS = 100
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+_queue = queue.Queue(maxsize=IMPORT_QUEUE_SIZE)
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_worker = None
+
+
+class ImportJob:
+    def __init__(self, path, filename, mode):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.mode = mode
+        self.status = "queued"
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.errors = []
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def progress(self, rows_read, rows_imported):
+        self.rows_read = rows_read
+        self.rows_imported = rows_imported
+
+    def to_dict(self):
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "mode": self.mode,
+            "status": self.status,
+            "done": self.status in ("completed", "failed"),
+            "rows_read": self.rows_read,
+            "rows_imported": self.rows_imported,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "rows_per_second": round(self.rows_imported / elapsed) if elapsed else None,
+            "errors": self.errors,
+            "result": self.result,
+        }
+
+
+def spool_upload(fileobj, suffix=".csv"):
+    """Copy an upload to a temp file that outlives the request; returns its path."""
+    fd, path = tempfile.mkstemp(prefix="soil-import-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(fileobj, out, SPOOL_CHUNK_BYTES)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="soil-import", daemon=True)
+            _worker.start()
+
+
+def submit(path, filename, mode="replace"):
+    """Queue an import of a spooled file. Raises queue.Full when the queue is full."""
+    job = ImportJob(path, filename, mode)
+    _queue.put_nowait(job)
+    with _lock:
+        _jobs[job.id] = job
+    _ensure_worker()
+    return job
+
+
+def get_job(job_id):
+    """Status dict of a job, or None if unknown (or long forgotten)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        status = job.to_dict()
+        if job.status == "queued":
+            status["queue_position"] = sum(
+                1 for j in _jobs.values() if j.status == "queued" and j.created_at < job.created_at
+            )
+    return status
+
+
+def _prune():
+    with _lock:
+        finished = [k for k, j in _jobs.items() if j.finished_at is not None]
+        for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[key]
+
+
+def _run(job):
+    from app.utils import soil_import
+
+    job.status = "running"
+    job.started_at = time.time()
+    db = SessionLocal()
+    try:
+        with open(job.path, "rb") as f:
+            job.result = soil_import.run_import(db, f, progress=job.progress, mode=job.mode)
+        job.status = "completed"
+        print(f"Import job {job.id}: {job.result['message']}")
+    except Exception as e:
+        db.rollback()
+        job.errors.append(str(e))
+        job.status = "failed"
+        print(f"Import job {job.id} failed: {e}")
+    finally:
+        db.close()
+        job.finished_at = time.time()
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+        _prune()
+
+
+def _work():
+    while True:
+        job = _queue.get()
+        try:
+            _run(job)
+        finally:
+            _queue.task_done()
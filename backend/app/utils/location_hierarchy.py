@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.utils import fast_json
+from app.utils.response_cache import CachedBody
+
+# State -> district -> subdistrict hierarchy of soil_farm_data for the
+# location dropdowns, kept serialized in memory with its ETag.
+#
+# soil_farm_data is loaded by outside tooling, so there is no import hook to
+# invalidate on. Instead, at most every LOCATIONS_TTL_SECONDS, the table's
+# write counters in pg_stat_user_tables (a catalog lookup, no scan) are
+# compared with the ones the cached hierarchy was built from; the DISTINCT
+# query only runs again when they moved.
+
+LOCATIONS_TTL_SECONDS = float(os.getenv("LOCATIONS_TTL_SECONDS", "60"))
+
+_lock = threading.Lock()
+_cache = {"checked_at": 0.0, "stamp": None, "entry": None}
+
+
+def _table_stamp(db):
+    return db.execute(text("""
+        SELECT n_tup_ins, n_tup_upd, n_tup_del
+        FROM pg_stat_user_tables
+        WHERE relname = 'soil_farm_data'
+    """)).fetchone()
+
+
+def build_hierarchy(db):
+    """Unique states, districts per state and subdistricts per district."""
+    # Served by the (state_name, district_name, subdistrict_name) index
+    query = text("SELECT DISTINCT state_name, district_name, subdistrict_name FROM soil_farm_data WHERE state_name IS NOT NULL")
+    result = db.execute(query).fetchall()
+
+    states = set()
+    districts = {} # state -> [districts]
+    subdistricts = {} # district -> [subdistricts]
+
+    for row in result:
+        state = row.state_name
+        district = row.district_name
+        subdistrict = row.subdistrict_name
+
+        states.add(state)
+        districts.setdefault(state, set()).add(district)
+        subdistricts.setdefault(district, set()).add(subdistrict)
+
+    # Convert sets to sorted lists
+    return {
+        "states": sorted(states),
+        "districts": {k: sorted(v) for k, v in districts.items()},
+        "subdistricts": {k: sorted(v) for k, v in subdistricts.items()}
+    }
+
+
+def cached():
+    """CachedBody of the hierarchy JSON, rebuilt only when the table changed."""
+    with _lock:
+        now = time.time()
+        if _cache["entry"] is not None and now - _cache["checked_at"] < LOCATIONS_TTL_SECONDS:
+            return _cache["entry"]
+
+        db = SessionLocal()
+        try:
+            stamp = tuple(_table_stamp(db) or ())
+            if _cache["entry"] is None or stamp != _cache["stamp"]:
+                start_time = time.time()
+                body = fast_json.dumps(build_hierarchy(db))
+                _cache["entry"] = CachedBody(body, "application/json")
+                _cache["stamp"] = stamp
+                print(f"Rebuilt location hierarchy in {time.time() - start_time:.3f}s")
+            _cache["checked_at"] = now
+        except Exception as e:
+            if _cache["entry"] is None:
+                raise
+            # Keep serving the last hierarchy; retried after the TTL
+            _cache["checked_at"] = now
+            print(f"Could not refresh location hierarchy: {e}")
+        finally:
+            db.close()
+        return _cache["entry"]
+
+
+def invalidate():
+    """Force a check against the database on the next request."""
+    with _lock:
+        _cache["checked_at"] = 0.0
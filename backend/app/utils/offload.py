@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for blocking GeoPandas / serialization work, so heavy map
+# requests never run on the event loop and cannot take more than
+# GEO_WORKERS threads between them. Threads rather than processes: the
+# cached GeoDataFrames live in this process, and shapely / pyogrio release
+# the GIL for the expensive parts.
+GEO_WORKERS = int(os.getenv("GEO_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=GEO_WORKERS, thread_name_prefix="geo-worker")
+
+# Separate pool for soil model scoring (crop_model): a scoring call takes
+# about a millisecond and must not queue behind map builds that take
+# seconds in the geo pool.
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "2"))
+
+_model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix="model-worker")
+
+# key -> future of the computation currently running for that key
+_inflight = {}
+
+
+async def run_in_pool(fn, *args, **kwargs):
+    """Run a blocking call in the bounded pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_model(fn, *args, **kwargs):
+    """Run a soil model call in the model pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_model_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_coalesced(key, fn, *args, **kwargs):
+    """
+    Like run_in_pool, but concurrent callers passing the same key share a
+    single run of fn and all get its result (or its exception).
+    """
+    future = _inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+        _inflight[key] = future
+
+        def _done(f, key=key):
+            if _inflight.get(key) is f:
+                del _inflight[key]
+
+        future.add_done_callback(_done)
+
+    # A client going away must not cancel the work other callers wait on
+    return await asyncio.shield(future)
@@ -0,0 +1,110 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+
+
+def make_etag(body):
+    """Strong ETag derived from the exact response bytes."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    If-None-Match check. The header may carry several tags or '*';
+    per RFC 9110 the comparison for If-None-Match is weak, so W/ is ignored.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class CachedBody:
+    __slots__ = ("body", "etag", "media_type")
+
+    def __init__(self, body, media_type):
+        self.body = body
+        self.etag = make_etag(body)
+        self.media_type = media_type
+
+
+class ResponseCache:
+    """
+    LRU cache of fully serialized response bodies, bounded by total bytes
+    rather than by entry count (one national subdistrict document can
+    weigh as much as hundreds of filtered district views).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, media_type="application/json"):
+        entry = CachedBody(body, media_type)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+
+            # Bodies larger than the whole budget are served but not kept
+            if len(body) > self.max_bytes:
+                return entry
+
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def respond(request, entry, headers=None):
+    """
+    Serve a cached body, or an empty 304 when the client already has it.
+    """
+    headers = dict(headers or {})
+    headers["ETag"] = entry.etag
+    headers.setdefault("Cache-Control", "no-cache")
+
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
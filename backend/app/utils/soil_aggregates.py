@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+# Per-region averages of soil_samples and soil_farm_data, materialized in
+# soil_region_aggregates (see models.SoilRegionAggregate).
+#
+# The table is refreshed inside the import transaction for the regions the
+# import touched, and every worker keeps an in-memory snapshot of it that
+# the map layers join against. The snapshot is re-read at most every
+# AGGREGATES_TTL_SECONDS, so refreshes made by other workers show up too.
+
+LEVELS = {
+    "state": "state_name",
+    "district": "district_name",
+    "subdistrict": "subdistrict_name",
+}
+
+AGGREGATE_COLUMNS = [
+    "nitrogen", "phosphorus", "potassium", "ph", "oc",
+    "zinc", "sulphur", "boron", "iron", "manganese", "copper",
+    "moisture", "rainfall", "humidity", "temperature",
+]
+
+# soil_farm_data only carries some of the attributes, under its own names
+FARM_DATA_COLUMNS = {
+    "nitrogen": "nitrogen",
+    "phosphorus": "phosphorus",
+    "potassium": "potassium",
+    "ph": "ph",
+    "oc": "organic_carbon",
+    "moisture": "moisture",
+}
+
+AGGREGATES_TTL_SECONDS = float(os.getenv("AGGREGATES_TTL_SECONDS", "300"))
+
+_lock = threading.Lock()
+_snapshot = {"version": 0, "loaded_at": 0.0, "stamp": None, "levels": {}}
+
+
+def region_key_sql(name_col):
+    """
+    SQL of a region key: the lower-cased, trimmed name. The expression
+    indexes on it (app/schema.py) must use this exact expression.
+    """
+    return f"lower(trim({name_col}))"
+
+
+def _source_sql(has_farm_data, name_col, key_filter=""):
+    """
+    Rows of both sample tables that name a region in name_col, as one row
+    set of region_key, region_name and the aggregate columns. key_filter is
+    added to each table's own WHERE (not applied on top of the union), so
+    "region_key = ANY(:keys)" is an index scan on that table's key index
+    instead of a full scan.
+    """
+    key = region_key_sql(name_col)
+    where = f"WHERE {name_col} IS NOT NULL AND trim({name_col}) <> ''" + key_filter.replace("region_key", key)
+    branches = []
+    # soil_samples has no state column
+    if name_col != "state_name":
+        samples_cols = ", ".join(f"{c}::float8 AS {c}" for c in AGGREGATE_COLUMNS)
+        branches.append(
+            f"SELECT {key} AS region_key, {name_col}::text AS region_name, {samples_cols} "
+            f"FROM soil_samples {where}"
+        )
+    if has_farm_data:
+        farm_cols = ", ".join(
+            f"{FARM_DATA_COLUMNS[c] if c in FARM_DATA_COLUMNS else 'NULL'}::float8 AS {c}"
+            for c in AGGREGATE_COLUMNS
+        )
+        branches.append(
+            f"SELECT {key} AS region_key, {name_col}::text AS region_name, {farm_cols} "
+            f"FROM soil_farm_data {where}"
+        )
+    return " UNION ALL ".join(branches) or None
+
+
+def _table_exists(db, name):
+    return db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"public.{name}"}).scalar()
+
+
+def refresh_region_aggregates(db, keys=None):
+    """
+    Recompute soil_region_aggregates in the caller's transaction.
+
+    keys maps level -> iterable of region keys (lower-cased, trimmed names)
+    to refresh; levels that are missing are left alone. keys=None rebuilds
+    every level from scratch. The caller commits.
+    """
+    has_farm_data = _table_exists(db, "soil_farm_data")
+    avg_cols = ", ".join(f"avg({c})" for c in AGGREGATE_COLUMNS)
+
+    for level, name_col in LEVELS.items():
+        params = {"level": level}
+        key_filter = ""
+        if keys is not None:
+            if not keys.get(level):
+                continue
+            params["keys"] = sorted(set(keys[level]))
+            key_filter = " AND region_key = ANY(:keys)"
+
+        db.execute(text(f"DELETE FROM soil_region_aggregates WHERE level = :level{key_filter}"), params)
+        source = _source_sql(has_farm_data, name_col, key_filter)
+        if source is None:
+            continue
+        db.execute(text(f"""
+            INSERT INTO soil_region_aggregates
+                (level, region_key, region_name, sample_count, {", ".join(AGGREGATE_COLUMNS)}, updated_at)
+            SELECT :level, region_key, min(region_name), count(*), {avg_cols}, now()
+            FROM ({source}) s
+            GROUP BY region_key
+        """), params)
+
+
+def touched_region_keys(db):
+    """
+    Region keys currently present in soil_samples, per level.
+    Taken before and after an import to know what to refresh.
+    """
+    rows = db.execute(text(
+        "SELECT DISTINCT lower(trim(district_name)), lower(trim(subdistrict_name)) FROM soil_samples"
+    )).fetchall()
+    return {
+        "district": {r[0] for r in rows if r[0]},
+        "subdistrict": {r[1] for r in rows if r[1]},
+    }
+
+
+def _load_snapshot():
+    import pandas as pd
+
+    db = SessionLocal()
+    try:
+        stamp = db.execute(text(
+            "SELECT count(*), max(updated_at) FROM soil_region_aggregates"
+        )).fetchone()
+        stamp = (stamp[0], stamp[1])
+        if stamp == _snapshot["stamp"]:
+            return stamp, None
+
+        df = pd.read_sql(text("SELECT * FROM soil_region_aggregates"), db.bind)
+        levels = {
+            level: group.drop(columns=["level"]).set_index("region_key")
+            for level, group in df.groupby("level")
+        }
+        return stamp, levels
+    finally:
+        db.close()
+
+
+def reload(force=False):
+    """
+    Re-read the aggregates table if the snapshot is stale (or forced).
+    Blocks on the database: call it from a worker thread, never from the
+    event loop.
+    """
+    if not force and not is_stale():
+        return
+    with _lock:
+        now = time.time()
+        # Another thread may have reloaded while this one waited for the lock
+        if not force and now - _snapshot["loaded_at"] < AGGREGATES_TTL_SECONDS:
+            return
+        # Set first so a failing database is retried once per TTL, not per request
+        _snapshot["loaded_at"] = now
+        try:
+            stamp, levels = _load_snapshot()
+        except Exception as e:
+            print(f"Could not load soil aggregates: {e}")
+            return
+        if levels is not None:
+            _snapshot["stamp"] = stamp
+            _snapshot["levels"] = levels
+            _snapshot["version"] += 1
+            print(f"Loaded soil aggregates: {stamp[0]} regions (version {_snapshot['version']})")
+
+
+def is_stale():
+    """True when the snapshot is older than the TTL and reload() would re-read it."""
+    return time.time() - _snapshot["loaded_at"] >= AGGREGATES_TTL_SECONDS
+
+
+# The readers below never take the lock or touch the database, so they are
+# safe on the event loop while a reload() is running elsewhere; they see the
+# previous snapshot until it finishes.
+
+def current_version():
+    """Snapshot version; changes whenever the in-memory aggregates change."""
+    return _snapshot["version"]
+
+
+def level_aggregates(level):
+    """DataFrame of averages for one level indexed by region key (may be empty)."""
+    return _snapshot["levels"].get(level)
@@ -0,0 +1,482 @@
+import io
+import itertools
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, text
+
+from app import models
+from app.utils import boundary_layers, soil_aggregates
+
+# Vectorized CSV -> soil_samples pipeline used by /import/soil-data.
+# Columns are normalized with pandas operations on the whole frame and the
+# rows are loaded with PostgreSQL COPY (or batched multi-row INSERTs on other
+# databases), instead of building one ORM object per row.
+
+# Map common aliases including Location
+RENAME_MAP = {
+    'n': 'nitrogen', 'p': 'phosphorus', 'k': 'potassium',
+    'ph': 'soil_ph', 'oc': 'soc', 'zinc': 'zn', 'sulphur': 's',
+    'iron': 'fe', 'manganese': 'mn', 'copper': 'cu', 'boron': 'b',
+    'd': 'district', 'dist': 'district', 'district_name': 'district',
+    'sdt': 'subdistrict', 'tehsil': 'subdistrict', 'block': 'subdistrict',
+    'sub_district': 'subdistrict',
+    'lat': 'latitude', 'lon': 'longitude', 'lng': 'longitude', 'long': 'longitude',
+    'id': 'sample_id', 'sampleid': 'sample_id', 'sample_no': 'sample_id',
+    # New columns from Crop_recommendation.csv
+    'temperature': 'temperature',
+    'humidity': 'humidity',
+    'soil_ph': 'ph', # CSV has soil_ph, model has ph
+    'soc': 'oc', # CSV has soc, model has oc
+    'soil_moisture': 'moisture',
+    'water_holding': 'water_holding_capacity',
+    'cec': 'cec',
+    'sand': 'sand',
+    'silt': 'silt',
+    'clay': 'clay'
+}
+
+REQUIRED_COLUMNS = ['nitrogen', 'phosphorus', 'potassium']
+
+DEFAULT_DISTRICT = "AMRITSAR"
+
+# Sub-districts list for auto-assignment (Mock for now, ideally fetch from shapefile)
+SUBDISTRICTS = [
+    "Ajnala", "Amritsar- I", "Amritsar- II", "Baba Bakala",
+    "Batala", "Dera Baba Nanak", "Dhar Kalan", "Gurdaspur",
+    "Pathankot", "Jalandhar - I", "Jalandhar - II", "Nakodar",
+    "Phillaur", "Shahkot", "Jagraon", "Khanna", "Ludhiana (East)",
+    "Ludhiana (West)", "Payal", "Raikot", "Samrala"
+]
+
+# soil_samples column -> CSV columns (after renaming) that may carry it.
+# The first non-null, numeric one wins.
+VALUE_COLUMNS = {
+    "nitrogen": ["nitrogen"],
+    "phosphorus": ["phosphorus"],
+    "potassium": ["potassium"],
+    "ph": ["ph", "soil_ph"],
+    "oc": ["oc", "soc"],
+    "moisture": ["moisture"],
+    "rainfall": ["rainfall"],
+    "temperature": ["temperature"],
+    "humidity": ["humidity"],
+    "cec": ["cec"],
+    "sand": ["sand"],
+    "silt": ["silt"],
+    "clay": ["clay"],
+    "water_holding_capacity": ["water_holding_capacity"],
+    "zinc": ["zn", "zinc"],
+    "sulphur": ["s", "sulphur"],
+    "boron": ["b", "boron"],
+    "iron": ["fe", "iron"],
+    "manganese": ["mn", "manganese"],
+    "copper": ["cu", "copper"],
+}
+
+SAMPLE_COLUMNS = ["district_name", "subdistrict_name"] + list(VALUE_COLUMNS) + ["source_key", "row_hash", "created_at"]
+
+# Columns that make up row_hash: everything an import can change
+HASHED_COLUMNS = ["district_name", "subdistrict_name"] + list(VALUE_COLUMNS)
+
+# Rows per INSERT statement on databases without COPY
+INSERT_BATCH_SIZE = 5000
+
+# Rows parsed, normalized and loaded at a time; bounds import memory
+# independently of the upload size.
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+
+
+class InvalidCSV(ValueError):
+    """The upload cannot be imported (empty, missing columns...)."""
+
+
+def normalize_headers(df):
+    """Lower-case, trim and rename CSV headers to the names used below."""
+    df.columns = [c.strip().lower() for c in df.columns]
+    return df.rename(columns=RENAME_MAP)
+
+
+def _unreadable(e):
+    """InvalidCSV for the errors pandas raises on files that are not CSV text."""
+    if isinstance(e, UnicodeDecodeError):
+        return InvalidCSV("The CSV file is not UTF-8 encoded.")
+    return InvalidCSV(f"The CSV file could not be parsed: {e}")
+
+
+def read_csv_chunks(fileobj, chunk_rows=IMPORT_CHUNK_ROWS):
+    """
+    Stream a CSV file object as header-normalized DataFrames of at most
+    chunk_rows rows; only one chunk is held in memory at a time.
+    """
+    try:
+        reader = pd.read_csv(fileobj, chunksize=chunk_rows, encoding="utf-8")
+    except pd.errors.EmptyDataError:
+        return
+    except (UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise _unreadable(e)
+    while True:
+        try:
+            chunk = next(reader)
+        except StopIteration:
+            return
+        except (UnicodeDecodeError, pd.errors.ParserError) as e:
+            raise _unreadable(e)
+        yield normalize_headers(chunk)
+
+
+def missing_columns(df):
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+def check_header(fileobj):
+    """Raise InvalidCSV unless the file has the required columns. Reads only the header."""
+    try:
+        header = normalize_headers(pd.read_csv(fileobj, nrows=0, encoding="utf-8"))
+    except pd.errors.EmptyDataError:
+        raise InvalidCSV("The CSV file is empty.")
+    except (UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise _unreadable(e)
+    missing = missing_columns(header)
+    if missing:
+        raise InvalidCSV(f"Missing columns: {missing}. Found: {list(header.columns)}")
+
+
+def _numeric(df, candidates):
+    values = pd.Series(np.nan, index=df.index, dtype="float64")
+    for col in candidates:
+        if col in df.columns:
+            values = values.fillna(pd.to_numeric(df[col], errors="coerce"))
+    return values
+
+
+def _text(df, col):
+    """Trimmed strings with blanks as NaN, or None if the column is absent."""
+    if col not in df.columns:
+        return None
+    values = df[col].astype(object).where(df[col].notna())
+    # map() turns an all-NaN column into float64; keep it object for .str
+    values = values.map(lambda v: str(v).strip(), na_action="ignore").astype(object)
+    return values.where(values != "")
+
+
+def has_coordinates(df):
+    return 'latitude' in df.columns and 'longitude' in df.columns
+
+
+def load_subdistrict_locator():
+    """Point index over the sub-district boundaries (shared with the map router)."""
+    return boundary_layers.load_point_locator(boundary_layers.SUBDISTRICT_SHP)
+
+
+def number_source_keys(db, keys):
+    """
+    Make one chunk's Series of source keys unique within the import. The
+    n-th occurrence of a key (n > 1, counted across all chunks so far)
+    becomes "id#n:..." / "hash#n:...": real keys start with exactly "id:" or
+    "hash:", so a numbered key can never equal one.
+
+    Numbered in SQL: the keys are COPYed into a temp table and counted
+    against soil_import_keys, an indexed temp table of the keys seen so far,
+    so a chunk costs in proportion to its own size and nothing grows in
+    memory. Only the renamed keys come back. Both tables are dropped at
+    commit. PostgreSQL only.
+    """
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS soil_import_keys "
+        "(source_key VARCHAR PRIMARY KEY, seen INTEGER NOT NULL) ON COMMIT DROP"
+    ))
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS soil_import_chunk_keys "
+        "(position INTEGER, source_key VARCHAR) ON COMMIT DROP"
+    ))
+    db.execute(text("TRUNCATE soil_import_chunk_keys"))
+    load_frame(db, "soil_import_chunk_keys", pd.DataFrame({
+        "position": np.arange(len(keys)),
+        "source_key": keys.to_numpy(),
+    }))
+
+    # Both parts of the statement read the counts from before this chunk
+    renamed = db.execute(text("""
+        WITH numbered AS (
+            -- A primary key lookup per row, never a join over all the
+            -- keys seen so far (the temp tables have no statistics)
+            SELECT c.position, c.source_key,
+                   coalesce((SELECT k.seen FROM soil_import_keys k WHERE k.source_key = c.source_key), 0)
+                   + row_number() OVER (PARTITION BY c.source_key ORDER BY c.position) AS occurrence
+            FROM soil_import_chunk_keys c
+        ), counted AS (
+            INSERT INTO soil_import_keys (source_key, seen)
+            SELECT source_key, max(occurrence) FROM numbered GROUP BY source_key
+            ON CONFLICT (source_key) DO UPDATE SET seen = EXCLUDED.seen
+        )
+        SELECT position, regexp_replace(source_key, ':', '#' || occurrence || ':')
+        FROM numbered WHERE occurrence > 1
+    """)).fetchall()
+
+    keys = keys.copy()
+    if renamed:
+        positions, new_keys = zip(*renamed)
+        keys.iloc[list(positions)] = new_keys
+    return keys
+
+
+def normalize_soil_frame(df, locator=None):
+    """
+    Turn a header-normalized CSV frame into soil_samples rows.
+
+    Rows without nitrogen and phosphorus are skipped. Missing districts and
+    sub-districts are taken from the boundary containing the row's
+    latitude/longitude when a locator (geolocate.PointLocator over the
+    sub-district layer) is given. Whatever is still missing falls back to
+    AMRITSAR and to a SUBDISTRICTS entry picked by a hash of the row's
+    values, so a row is assigned the same way wherever it sits in the file.
+    Each row gets a source_key (the CSV sample_id, else that content hash;
+    see number_source_keys for repeats) and a row_hash of its values.
+    """
+    # Skip empty rows (if N, P, K are all missing)
+    keep = ~(df['nitrogen'].isna() & df['phosphorus'].isna())
+    df = df[keep]
+
+    out = pd.DataFrame(index=df.index)
+
+    district = _text(df, 'district')
+    if district is None:
+        district = pd.Series(np.nan, index=df.index, dtype=object)
+    subdistrict = _text(df, 'subdistrict')
+    if subdistrict is None:
+        subdistrict = pd.Series(np.nan, index=df.index, dtype=object)
+
+    # Coordinates -> boundary, one bulk spatial join for the whole chunk
+    if locator is not None and has_coordinates(df) and (district.isna().any() or subdistrict.isna().any()):
+        rows = locator.locate(pd.to_numeric(df['longitude'], errors="coerce"),
+                              pd.to_numeric(df['latitude'], errors="coerce"))
+        district = district.fillna(pd.Series(locator.lookup(rows, "district"), index=df.index))
+        subdistrict = subdistrict.fillna(pd.Series(locator.lookup(rows, "subdistrict"), index=df.index))
+
+    # 1. District
+    # Priority: CSV 'district' -> Coordinates -> Default "AMRITSAR"
+    out["district_name"] = district.str.strip().str.upper().fillna(DEFAULT_DISTRICT)
+    out["subdistrict_name"] = subdistrict
+
+    for col, candidates in VALUE_COLUMNS.items():
+        out[col] = _numeric(df, candidates)
+
+    # What the file says about the row, before any fallback is filled in.
+    # Independent of the row's position, unlike a row number.
+    content = pd.util.hash_pandas_object(out[HASHED_COLUMNS], index=False).to_numpy()
+
+    # 2. Sub-District
+    # Priority: CSV 'subdistrict' -> Coordinates -> Spread by content hash
+    missing = subdistrict.isna().to_numpy()
+    if missing.any():
+        picks = content[missing] % np.uint64(len(SUBDISTRICTS))
+        out.loc[missing, "subdistrict_name"] = np.asarray(SUBDISTRICTS, dtype=object)[picks.astype(np.intp)]
+
+    content_keys = pd.Series(content, index=df.index).map("hash:{:016x}".format)
+    sample_id = _text(df, 'sample_id')
+    out["source_key"] = ("id:" + sample_id).fillna(content_keys) if sample_id is not None else content_keys
+    out["row_hash"] = pd.util.hash_pandas_object(out[HASHED_COLUMNS], index=False).to_numpy().view(np.int64)
+
+    out["created_at"] = datetime.utcnow()
+    return out[SAMPLE_COLUMNS]
+
+
+def load_frame(db, table, frame):
+    """
+    Bulk-load a frame into `table` inside the session's transaction.
+    PostgreSQL gets a single COPY; other databases multi-row INSERTs.
+    """
+    if frame.empty:
+        return 0
+
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        buf = io.StringIO()
+        # Unquoted empty fields are NULL in CSV COPY
+        frame.to_csv(buf, index=False, header=False, na_rep="")
+        buf.seek(0)
+        columns = ", ".join(frame.columns)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+        finally:
+            cursor.close()
+    else:
+        target = models.Base.metadata.tables[table]
+        records = frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+        for start in range(0, len(records), INSERT_BATCH_SIZE):
+            db.execute(insert(target), records[start:start + INSERT_BATCH_SIZE])
+
+    return len(frame)
+
+
+def upsert_frame(db, frame):
+    """
+    Insert new rows of a normalized frame and update changed ones (by
+    source_key / row_hash), leaving unchanged rows untouched. PostgreSQL
+    only: the frame is COPYed into a temp staging table, then merged with
+    one INSERT ... ON CONFLICT.
+
+    Returns (inserted, updated, touched) where touched maps level -> region
+    keys of the rows written, before and after the change.
+    """
+    touched = {"district": set(), "subdistrict": set()}
+    if frame.empty:
+        return 0, 0, touched
+
+    # Drop rows whose stored hash already matches before going near the
+    # table, so unchanged rows cost one index lookup and no writes
+    stored = pd.Series(dict(db.execute(
+        text("SELECT source_key, row_hash FROM soil_samples WHERE source_key = ANY(:keys)"),
+        {"keys": frame["source_key"].tolist()},
+    ).fetchall()), dtype="Int64")
+    known = stored.reindex(frame["source_key"].to_numpy()).to_numpy()
+    changed = pd.Series(frame["row_hash"].to_numpy(), dtype="Int64").ne(known).fillna(True)
+    frame = frame[changed.to_numpy(dtype=bool)]
+    if frame.empty:
+        return 0, 0, touched
+
+    columns = ", ".join(frame.columns)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in frame.columns if c != "created_at")
+
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS soil_samples_stage ON COMMIT DROP AS "
+        f"SELECT {columns} FROM soil_samples WITH NO DATA"
+    ))
+    db.execute(text("TRUNCATE soil_samples_stage"))
+    load_frame(db, "soil_samples_stage", frame)
+
+    def add_regions(rows):
+        for district, subdistrict in rows:
+            if district:
+                touched["district"].add(district)
+            if subdistrict:
+                touched["subdistrict"].add(subdistrict)
+
+    # Where changed rows used to be, in case they moved region
+    add_regions(db.execute(text("""
+        SELECT DISTINCT lower(trim(s.district_name)), lower(trim(s.subdistrict_name))
+        FROM soil_samples s JOIN soil_samples_stage t USING (source_key)
+        WHERE s.row_hash IS DISTINCT FROM t.row_hash
+    """)).fetchall())
+
+    rows = db.execute(text(f"""
+        WITH merged AS (
+            INSERT INTO soil_samples ({columns})
+            SELECT {columns} FROM soil_samples_stage
+            ON CONFLICT (source_key) DO UPDATE SET {updates}
+            WHERE soil_samples.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+            RETURNING (xmax = 0) AS inserted, district_name, subdistrict_name
+        )
+        SELECT inserted, lower(trim(district_name)), lower(trim(subdistrict_name)), count(*)
+        FROM merged GROUP BY 1, 2, 3
+    """)).fetchall()
+
+    inserted = sum(r[3] for r in rows if r[0])
+    updated = sum(r[3] for r in rows if not r[0])
+    add_regions((r[1], r[2]) for r in rows)
+    return inserted, updated, touched
+
+
+def run_import(db, fileobj, progress=None, mode="replace"):
+    """
+    Load a CSV file object into soil_samples.
+
+    mode="replace" empties the table first; mode="incremental" upserts by
+    source_key and only writes rows that are new or whose values changed
+    (rows missing from the file are kept), so a re-sync costs in proportion
+    to what changed and leaves the aggregates of untouched regions alone.
+    Rows without a sample id are keyed by their values, so inserting or
+    reordering lines does not touch the others; an edited keyless row is a
+    new row, its old version stays like any row dropped from the file.
+
+    The file is streamed in chunks: each chunk is normalized column-wise and
+    bulk-loaded (COPY) before the next is read, all in one transaction, so
+    memory stays flat whatever the file size. Aggregates of the touched
+    regions are refreshed in the same transaction. progress(rows_read,
+    rows_imported) is called after every chunk. Returns a summary dict.
+    """
+    start_time = time.perf_counter()
+
+    chunks = read_csv_chunks(fileobj)
+    first = next(chunks, None)
+    if first is None:
+        raise InvalidCSV("The CSV file is empty.")
+    missing = missing_columns(first)
+    if missing:
+        raise InvalidCSV(f"Missing columns: {missing}. Found: {list(first.columns)}")
+
+    # A background job in one transaction; not bound by the API statement timeout
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+
+    locator = load_subdistrict_locator() if has_coordinates(first) else None
+
+    incremental = mode == "incremental"
+    if incremental:
+        touched = {"district": set(), "subdistrict": set()}
+    else:
+        # Regions that lose their samples below need their aggregates refreshed too
+        touched = soil_aggregates.touched_region_keys(db)
+
+        # Clear existing data to avoid duplicates confusing the map
+        db.query(models.SoilSample).delete()
+
+    rows_read = 0
+    imported_count = 0
+    inserted = updated = 0
+    unique_districts = set()
+    for chunk in itertools.chain([first], chunks):
+        rows_read += len(chunk)
+        samples = normalize_soil_frame(chunk, locator)
+        samples["source_key"] = number_source_keys(db, samples["source_key"])
+        if incremental:
+            ins, upd, chunk_touched = upsert_frame(db, samples)
+            inserted += ins
+            updated += upd
+            for level, keys in chunk_touched.items():
+                touched[level] |= keys
+            imported_count += len(samples)
+        else:
+            imported_count += load_frame(db, models.SoilSample.__tablename__, samples)
+        unique_districts |= set(samples["district_name"].unique().tolist())
+        if progress:
+            progress(rows_read, imported_count)
+
+    if not incremental:
+        inserted = imported_count
+        # Old + new regions
+        for level, keys in soil_aggregates.touched_region_keys(db).items():
+            touched[level] |= keys
+
+    # Refresh the materialized map aggregates, in the same transaction as the import
+    changed = any(touched.values())
+    if changed:
+        soil_aggregates.refresh_region_aggregates(db, touched)
+
+    db.commit()
+    if changed:
+        soil_aggregates.reload(force=True)
+    elapsed = time.perf_counter() - start_time
+
+    if incremental:
+        message = (f"Synced {imported_count} records: {inserted} new, {updated} updated, "
+                   f"{imported_count - inserted - updated} unchanged.")
+    else:
+        message = f"Successfully imported {imported_count} records into {len(unique_districts)} districts."
+
+    return {
+        "message": message,
+        "mode": mode,
+        "districts": sorted(unique_districts),
+        "rows": imported_count,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": imported_count - inserted - updated,
+        "rows_skipped": rows_read - imported_count,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(imported_count / elapsed) if elapsed > 0 else None,
+    }
@@ -0,0 +1,146 @@
+import math
+
+# Mapbox Vector Tile constants
+# Every tile is 4096 x 4096 units internally; the buffer keeps polygon
+# outlines from showing seams at tile edges.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+# Half the width of the Web Mercator (EPSG:3857) world in metres
+WEB_MERCATOR_HALF = 20037508.342789244
+
+
+def is_valid_tile(z, x, y):
+    if z < 0 or z > MAX_ZOOM:
+        return False
+    n = 2 ** z
+    return 0 <= x < n and 0 <= y < n
+
+
+def tile_size(z):
+    """Width (and height) of a tile at zoom z in Web Mercator metres."""
+    return 2 * WEB_MERCATOR_HALF / (2 ** z)
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile.
+    y counts downwards from the north edge, as used by Leaflet / Mapbox.
+    """
+    size = tile_size(z)
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def buffered_bounds(z, x, y, buffer=TILE_BUFFER):
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    pad = tile_size(z) * buffer / TILE_EXTENT
+    return (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+
+def degrees_per_pixel(z):
+    """Width of one pixel of a 256px tile at zoom z, in degrees of longitude."""
+    return 360.0 / (256 * 2 ** z)
+
+
+def parse_bbox(value):
+    """
+    Parse a "minx,miny,maxx,maxy" (lon/lat) query value into floats.
+    Raises ValueError when it is malformed.
+    """
+    parts = value.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox must be minx,miny,maxx,maxy")
+    minx, miny, maxx, maxy = (float(p) for p in parts)
+    if not all(math.isfinite(v) for v in (minx, miny, maxx, maxy)):
+        raise ValueError("bbox values must be finite numbers")
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox must be minx,miny,maxx,maxy with min <= max")
+    return (minx, miny, maxx, maxy)
+
+
+# Viewport grid cells are 1/4 to 1/2 of the bbox's larger side
+BBOX_GRID_DIVISIONS = 2
+
+
+def snap_bbox(bbox):
+    """
+    Grow a lon/lat bbox outwards to a grid of square cells, 360 / 2**z
+    degrees wide with z picked from the bbox's larger side. Viewports that
+    differ by a small pan or zoom snap to the same bbox; the result covers
+    the original and is at most twice as wide and tall.
+    """
+    minx, miny, maxx, maxy = bbox
+    span = max(maxx - minx, maxy - miny)
+    z = MAX_ZOOM if span <= 0 else math.floor(math.log2(360.0 / span)) + BBOX_GRID_DIVISIONS
+    cell = 360.0 / (2 ** min(MAX_ZOOM, max(0, z)))
+    return (
+        max(-180.0, math.floor(minx / cell) * cell),
+        max(-90.0, math.floor(miny / cell) * cell),
+        min(180.0, math.ceil(maxx / cell) * cell),
+        min(90.0, math.ceil(maxy / cell) * cell),
+    )
+
+
+def clean_properties(row):
+    """
+    MVT only supports scalar attributes and rejects None/NaN values.
+    """
+    props = {}
+    for key, val in row.items():
+        if val is None:
+            continue
+        if isinstance(val, float) and math.isnan(val):
+            continue
+        if hasattr(val, "item"):  # numpy scalar -> python scalar
+            val = val.item()
+        if isinstance(val, (str, int, float, bool)):
+            props[key] = val
+        else:
+            props[key] = str(val)
+    return props
+
+
+def encode_tile(layer_name, gdf_mercator, z, x, y):
+    """
+    Cut one vector tile out of a GeoDataFrame in EPSG:3857.
+
+    Only features intersecting the (buffered) tile are touched thanks to the
+    spatial index, and geometries are simplified to the tile's pixel size so
+    low zooms stay small. Returns the encoded protobuf bytes, or None when the
+    tile is empty.
+    """
+    import mapbox_vector_tile
+    from shapely.geometry import box
+    import shapely
+
+    bounds = tile_bounds(z, x, y)
+    clip = buffered_bounds(z, x, y)
+
+    hits = gdf_mercator.sindex.query(box(*clip), predicate="intersects")
+    if len(hits) == 0:
+        return None
+
+    subset = gdf_mercator.iloc[hits]
+
+    # One tile unit in metres - anything smaller is invisible at this zoom
+    tolerance = tile_size(z) / TILE_EXTENT
+    geoms = shapely.simplify(subset.geometry.values, tolerance, preserve_topology=True)
+    geoms = shapely.clip_by_rect(geoms, *clip)
+
+    attrs = subset.drop(columns=subset.geometry.name)
+    features = []
+    for geom, (_, row) in zip(geoms, attrs.iterrows()):
+        if geom is None or geom.is_empty:
+            continue
+        features.append({"geometry": geom, "properties": clean_properties(row)})
+
+    if not features:
+        return None
+
+    return mapbox_vector_tile.encode(
+        [{"name": layer_name, "features": features}],
+        default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT},
+    )
@@ -0,0 +1,87 @@
+# TopoJSON helpers
+# A topology stores every border as one "arc"; polygons reference arcs by
+# index (negative ~i = arc i reversed). Neighbouring districts therefore
+# share one copy of their common border instead of two.
+
+# 1e6 grid steps across the layer's extent - well below a pixel at any
+# zoom we serve, and it lets the arcs be delta-encoded as small integers.
+QUANTIZATION = 1e6
+
+
+def build_topology(gdf, quantization=QUANTIZATION):
+    """
+    topojson.Topology of every geometry in a GeoDataFrame.
+    Geometries keep the row order of gdf, properties are left empty so the
+    result can be shared by all requests on the layer.
+    """
+    import topojson
+
+    return topojson.Topology(gdf[[gdf.geometry.name]], prequantize=quantization)
+
+
+def simplified_topology(topo, tolerance=0):
+    """
+    Dict of a topology from build_topology with its arcs simplified
+    (Douglas-Peucker, tolerance in layer units; 0 keeps full detail).
+    Every arc is simplified once for all the geometries that use it, so
+    neighbouring polygons keep sharing the exact same border.
+    """
+    if tolerance:
+        topo = topo.toposimplify(tolerance)
+    return topo.to_dict()
+
+
+def topology_geometries(topo):
+    """
+    Shapely geometries of a topology dict from simplified_topology, in the
+    row order of the layer it was built from (None where a geometry
+    collapsed). Geometries decoded from the same topology share their
+    borders exactly, like the TopoJSON output.
+    """
+    from shapely.geometry import shape
+    from topojson.utils import serialize_as_geojson
+
+    features = serialize_as_geojson(topo, objectname="data")["features"]
+    return [shape(f["geometry"]) if f["geometry"] else None for f in features]
+
+
+def subset_topology(topo, positions, properties, object_name):
+    """
+    TopoJSON document for the geometries at `positions` (row numbers into the
+    layer used by build_topology), with only the arcs they reference,
+    renumbered. `properties` is one dict per position.
+    """
+    arcs = topo["arcs"]
+    geometries = topo["objects"]["data"]["geometries"]
+
+    remapped = {}
+    new_arcs = []
+
+    def remap(ref):
+        if isinstance(ref, list):
+            return [remap(r) for r in ref]
+        idx = ref if ref >= 0 else ~ref
+        new_idx = remapped.get(idx)
+        if new_idx is None:
+            new_idx = remapped[idx] = len(new_arcs)
+            new_arcs.append(arcs[idx])
+        return new_idx if ref >= 0 else ~new_idx
+
+    out = []
+    for pos, props in zip(positions, properties):
+        geom = geometries[pos]
+        new_geom = {"type": geom["type"], "properties": props}
+        if "arcs" in geom:
+            new_geom["arcs"] = remap(geom["arcs"])
+        if "coordinates" in geom:
+            new_geom["coordinates"] = geom["coordinates"]
+        out.append(new_geom)
+
+    result = {
+        "type": "Topology",
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": out}},
+        "arcs": new_arcs,
+    }
+    if "transform" in topo:
+        result["transform"] = topo["transform"]
+    return result